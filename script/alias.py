@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import os
+
+import patfile
+
+
+# Names at the Same Offset of the Module
+def get_alias(m):
+    entry = {}
+    for offset, name, _ in m.public:
+        if offset not in entry:
+            entry[offset] = set()
+        entry[offset].add(name)
+    return entry.values()
+
+
+# Names at the Same Offset of Each Module Line in Pattern File
+def read_pattern(file):
+    for m in patfile.PatternReader(file):
+        yield from get_alias(m)
+
+
+# Alias Names of the Modules (consumer of patfile.scan)
+class AliasCollector:
+    def __init__(self):
+        self.group = []
+
+    def module(self, m):
+        self.group.extend(get_alias(m))
+
+    def finish(self, terminated):
+        return self.group
+
+
+# Alias Graph of Names by Union-Find
+class AliasGraph:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.source = {}
+        self.dirty = False
+
+    def find(self, name):
+        parent = self.parent
+        if name not in parent:
+            parent[name] = name
+            self.size[name] = 1
+            return name
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(self, group):
+        root = None
+        for name in group:
+            r = self.find(name)
+            if root is None:
+                root = r
+            elif r != root:
+                if self.size[root] < self.size[r]:
+                    root, r = r, root
+                self.parent[r] = root
+                self.size[root] += self.size[r]
+
+    # Add the Groups of the Source (e.g. pattern file) Replacing Old Ones
+    def add(self, source, group):
+        if source in self.source:
+            self.remove(source)
+        group = [g for g in group if g]
+        self.source[source] = group
+        if not self.dirty:
+            for g in group:
+                self.union(g)
+
+    # Remove the Groups of the Source (rebuilt at the next access)
+    def remove(self, source):
+        if self.source.pop(source, None):
+            self.dirty = True
+
+    def rebuild(self):
+        self.parent = {}
+        self.size = {}
+        for group in self.source.values():
+            for g in group:
+                self.union(g)
+        self.dirty = False
+
+    # Connected Names
+    def group(self):
+        if self.dirty:
+            self.rebuild()
+        component = {}
+        for name in self.parent:
+            component.setdefault(self.find(name), []).append(name)
+        return list(component.values())
+
+    def name(self, source=None):
+        if self.dirty:
+            self.rebuild()
+        if source is None:
+            return set(self.parent)
+        return {n for s in source for g in self.source.get(s, ())
+                for n in g}
+
+
+# Alias Groups of the Pattern File
+def parse(file):
+    graph = AliasGraph()
+    graph.add(file, read_pattern(file))
+    return sorted(sorted(g) for g in graph.group())
+
+
+# name_alternate.csv
+def write_alternate(file, group):
+    group = map(lambda g: sorted(g, key=lambda s: (len(s), s.swapcase())),
+                group)
+    with open(file, 'w') as f:
+        for g in sorted(group):
+            f.write(','.join(g) + '\n')
+
+
+def read_alternate(file):
+    with open(file) as f:
+        return [set(s.strip().split(',')) for s in f if s.strip()]
+
+
+# name_ignore.txt
+def write_ignore(file, name):
+    with open(file, 'w') as f:
+        for s in sorted(name):
+            f.write(s + '\n')
+
+
+def read_ignore(file):
+    with open(file) as f:
+        return {s.strip() for s in f if s.strip()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Alias of Names.')
+    parser.add_argument('path', nargs='+', help='pattern file')
+    parser.add_argument('-o', '--output', default='.',
+                        help='directory of name files')
+    args = vars(parser.parse_args())
+    pattern = sorted({p for arg in args['path'] for p in glob.glob(arg)
+                      if os.path.isfile(p)})
+    graph = AliasGraph()
+    for pat in pattern:
+        graph.add(pat, read_pattern(pat))
+    write_alternate(os.path.join(args['output'], 'name_alternate.csv'),
+                    graph.group())
+    write_ignore(os.path.join(args['output'], 'name_ignore.txt'),
+                 graph.name(pat for pat in pattern
+                            if os.path.basename(pat).startswith('_libgcc_')))
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+try:
+    import elftools.common.exceptions
+    import elftools.elf.elffile
+    import elftools.elf.sections
+except ImportError:
+    pyelftools = False
+else:
+    pyelftools = True
+
+import alias
+import chksig
+import fakeida
+import patfile
+import pkg2sig
+import prepare
+
+
+# Pattern Files
+def bench_pattern(file, repeat):
+    case = [('read_pattern (split)',
+             lambda f: sorted(map(sorted, read_pattern_split(f)))),
+            ('read_pattern',
+             lambda f: sorted(map(sorted, alias.read_pattern(f)))),
+            ('hash_pattern (function)',
+             lambda f: pkg2sig.hash_pattern(f, True)),
+            ('read_pattern + hash_pattern',
+             lambda f: (list(alias.read_pattern(f)),
+                        pkg2sig.hash_pattern(f, True))),
+            ('scan (alias, hash)',
+             lambda f: patfile.scan(f, alias.AliasCollector(),
+                                    patfile.FunctionHash()))]
+    result = {}
+    for name, func in case:
+        result[name] = measure(func, file, repeat)
+    diff = [f for f, a, b in zip(file, result['read_pattern (split)'][1],
+                                 result['read_pattern'][1])
+            if a != b]
+    for f in diff:
+        print('Differ:', f, file=sys.stderr)
+    return {name: t for name, (t, _) in result.items()}
+
+
+# Synthetic ELF: (machine, bits, endianness)
+SYNTHETIC_MACHINE = ((3, 32, '<'), (8, 32, '>'), (8, 32, '<'), (20, 32, '>'),
+                     (40, 32, '<'), (42, 32, '<'), (42, 32, '>'),
+                     (62, 64, '<'))
+SYNTHETIC_PAYLOAD = ('code', 'random', 'packed')
+BENCHMARK_VERSION = 1
+
+
+# Previous is_strip of chksig.py
+def is_strip_pyelftools(file):
+    ret = False
+    with open(file, 'rb') as f:
+        try:
+            elf = elftools.elf.elffile.ELFFile(f)
+            ret = True
+            for section in elf.iter_sections():
+                if isinstance(section,
+                              elftools.elf.sections.SymbolTableSection):
+                    ret = False
+                    break
+        except elftools.common.exceptions.ELFError:
+            pass
+    return ret
+
+
+# Previous read_pattern of alias.py
+def read_pattern_split(file):
+    with open(file) as f:
+        for s in f:
+            element = s.split()
+            if len(element) < 5:
+                continue
+            entry = {}
+            element.pop(0)
+            element.pop(0)
+            element.pop(0)
+            element.pop(0)
+            while len(element) >= 2:
+                e = element.pop(0)
+                if e.startswith(':'):
+                    e = e.lstrip(':').rstrip('@')
+                    if re.fullmatch(r'-?[\da-fA-F]+', e):
+                        entry.setdefault(int(e, 16), set()). \
+                            add(element.pop(0))
+            yield from entry.values()
+
+
+# Best Time of Repeated Calls
+def measure(func, file, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = [func(f) for f in file]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, ret
+
+
+# ELF Reader
+def bench_elf(file, repeat):
+    case = [('get_elf_info', prepare.get_elf_info),
+            ('get_elf_attr', prepare.get_elf_attr),
+            ('is_strip', chksig.is_strip)]
+    if pyelftools:
+        case.append(('is_strip (pyelftools)', is_strip_pyelftools))
+    result = {}
+    for name, func in case:
+        result[name] = measure(func, file, repeat)
+    if pyelftools:
+        diff = [f for f, a, b in zip(file, result['is_strip'][1],
+                                     result['is_strip (pyelftools)'][1])
+                if a != b]
+        for f in diff:
+            print('Differ:', f, file=sys.stderr)
+    return {name: t for name, (t, _) in result.items()}
+
+
+# Random Bytes of the Payload
+# code: low entropy of the instruction words, random: uniform bytes,
+# packed: UPX-like header and compressed (uniform) body
+def get_payload(rnd, kind, size):
+    if kind == 'code':
+        word = [rnd.getrandbits(32).to_bytes(4, 'little') for _ in range(16)]
+        return b''.join(rnd.choice(word) for _ in range(size // 4))
+    data = rnd.getrandbits(8 * size).to_bytes(size, 'little')
+    if kind == 'packed':
+        data = b'UPX!' + data[4:size // 2] + b'UPX!' + data[size // 2 + 4:]
+    return data
+
+
+# Synthetic ELF of the Header, a Program Header and a Section Table
+# The section table has .text, .shstrtab and optionally .symtab.
+def write_elf(file, machine, bits, endian, payload, symtab=False):
+    addr = 'I' if bits == 32 else 'Q'
+    ehsize = 52 if bits == 32 else 64
+    phentsize = 32 if bits == 32 else 56
+    shentsize = 40 if bits == 32 else 64
+    shstrtab = b'\0.text\0.shstrtab\0.symtab\0'
+    text = ehsize + phentsize
+    strtab = text + len(payload)
+    shoff = (strtab + len(shstrtab) + 7) & ~7
+    vaddr = 0x400000
+    section = [(0, 0, 0, 0, 0, 0),
+               (1, 1, 6, vaddr + text, text, len(payload)),
+               (7, 3, 0, 0, strtab, len(shstrtab))]
+    if symtab:
+        section.append((17, 2, 0, 0, strtab, 0))
+    buf = bytearray(b'\x7FELF')
+    buf += bytes((1 if bits == 32 else 2, 1 if endian == '<' else 2, 1))
+    buf += bytes(9)
+    buf += struct.pack(endian + 'HHI' + addr * 3 + 'IHHHHHH', 2, machine, 1,
+                       vaddr + text, ehsize, shoff, 0, ehsize, phentsize, 1,
+                       shentsize, len(section), 2)
+    if bits == 32:
+        buf += struct.pack(endian + 'IIIIIIII', 1, 0, vaddr, vaddr,
+                           strtab, strtab, 5, 0x1000)
+    else:
+        buf += struct.pack(endian + 'IIQQQQQQ', 1, 5, 0, vaddr, vaddr,
+                           strtab, strtab, 0x1000)
+    buf += payload + shstrtab
+    buf += bytes(shoff - len(buf))
+    fmt = endian + ('IIIIIIIIII' if bits == 32 else 'IIQQQQIIQQ')
+    for name, type, flags, sh_addr, offset, size in section:
+        buf += struct.pack(fmt, name, type, flags, sh_addr, offset, size,
+                           0, 0, 1, 0)
+    with open(file, 'wb') as f:
+        f.write(buf)
+
+
+# Synthetic Pattern File in the Format of pelf
+# Module line: leading bytes, CRC length, CRC, size, public names (with the
+# aliases at the same offset), referenced names and tail bytes
+def write_pattern(file, rnd, name, module, alias_density):
+    with open(file, 'w', newline='\n') as f:
+        for _ in range(module):
+            lead = ''.join('..' if rnd.random() < 0.1
+                           else '{:02X}'.format(rnd.getrandbits(8))
+                           for _ in range(32))
+            size = rnd.randint(0x20, 0x800)
+            public = [(0, rnd.choice(name))]
+            if rnd.random() < alias_density:
+                public.append((0, rnd.choice(('__GI_', '__libc_', '_'))
+                               + public[0][1]))
+            if rnd.random() < 0.2:
+                public.append((rnd.randrange(4, size, 4), rnd.choice(name)))
+            line = [lead, '{:02X}'.format(rnd.randint(0, 0xff)),
+                    '{:04X}'.format(rnd.getrandbits(16)),
+                    '{:04X}'.format(size)]
+            for offset, n in public:
+                line.append(':{:04X}'.format(offset))
+                line.append(n)
+            for _ in range(rnd.randint(0, 3)):
+                line.append('^{:04X}'.format(rnd.randrange(0, size)))
+                line.append(rnd.choice(name))
+            line.append(''.join('{:02X}'.format(rnd.getrandbits(8))
+                                for _ in range(rnd.randint(0, 16))))
+            f.write(' '.join(line).rstrip() + '\n')
+        f.write('---\n')
+
+
+# Synthetic Corpus of ELF Files and Pattern Files
+# About a quarter of the pattern files are copies of the former ones, as the
+# same library is shipped by several versions of the distribution.
+def generate_corpus(dir, n_elf, n_pattern, seed=0, size=1 << 18,
+                    module=500, alias_density=0.3):
+    rnd = random.Random(seed)
+    elf = []
+    os.makedirs(os.path.join(dir, 'elf'), exist_ok=True)
+    for i in range(n_elf):
+        machine, bits, endian = SYNTHETIC_MACHINE[i % len(SYNTHETIC_MACHINE)]
+        kind = SYNTHETIC_PAYLOAD[i // len(SYNTHETIC_MACHINE)
+                                 % len(SYNTHETIC_PAYLOAD)]
+        file = os.path.join(dir, 'elf', '{:06d}_{}_{}'.format(i, machine,
+                                                              kind))
+        write_elf(file, machine, bits, endian, get_payload(rnd, kind, size),
+                  symtab=rnd.random() < 0.2)
+        elf.append(file)
+    name = list(fakeida.FUNCTION_NAME)
+    name += ['func_{:04x}'.format(i) for i in range(module * 4)]
+    pattern = []
+    os.makedirs(os.path.join(dir, 'pat'), exist_ok=True)
+    for i in range(n_pattern):
+        library = '_libgcc_' if i % 4 == 3 else '_libc_'
+        file = os.path.join(dir, 'pat', '{}synthetic-1.{}-armv4l.pat'.
+                            format(library, i))
+        if pattern and rnd.random() < 0.25:
+            shutil.copyfile(rnd.choice(pattern), file)
+        else:
+            write_pattern(file, rnd, name, module, alias_density)
+        pattern.append(file)
+    return elf, pattern
+
+
+# Best Time of Repeated Calls after Setup (not measured)
+def measure_setup(setup, func, repeat):
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Non-IDA Code Paths on the Synthetic Corpus
+# {name: {'time': best seconds, 'count': items, 'per_item': seconds}}
+def bench_synthetic(elf, pattern, repeat):
+    triage_args = {'cache': None, 'results': None, 'ignore_entropy': False,
+                   'ignore_machine': False, 'ignore_strip': False}
+    result = {}
+    for name, func in (('entropy', prepare.entropy),
+                       ('get_elf_attr', prepare.get_elf_attr),
+                       ('is_strip', chksig.is_strip),
+                       ('get_triage',
+                        lambda f: chksig.get_triage(f, triage_args))):
+        result[name] = (measure(func, elf, repeat)[0], len(elf))
+    with tempfile.TemporaryDirectory() as tmp:
+        def copy():
+            dst = os.path.join(tmp, 'pat')
+            shutil.rmtree(dst, ignore_errors=True)
+            os.makedirs(dst)
+            for pat in pattern:
+                shutil.copy2(pat, dst)
+            return [os.path.join(dst, os.path.basename(p)) for p in pattern]
+
+        # Cold: without the digest cache, Warm: digests from the cache
+        def setup(warm):
+            build = pkg2sig.BuildManifest(os.path.join(tmp, 'build.json'))
+            if warm:
+                pkg2sig.dedup_pattern(copy(), build)
+            return copy(), build
+
+        for name, warm in (('dedup_pattern', False),
+                           ('dedup_pattern_warm', True)):
+            result[name] = (measure_setup(
+                lambda: setup(warm),
+                lambda a: pkg2sig.dedup_pattern(*a), repeat),
+                len(pattern))
+        # Name files from all the patterns without the previous record
+        result['name_file'] = (measure_setup(
+            lambda: pkg2sig.BuildManifest(os.path.join(tmp, 'name.json')),
+            lambda b: pkg2sig.write_name_file(b, pattern, tmp), repeat),
+            len(pattern))
+    return {name: {'time': t, 'count': n, 'per_item': t / n if n else 0}
+            for name, (t, n) in result.items()}
+
+
+# Compare with the Baseline Report
+# The time per item is compared, since the corpus may be different.
+# {name: (ratio, regression)}
+def compare(result, baseline, threshold):
+    ret = {}
+    for name, r in result.items():
+        b = baseline.get('result', {}).get(name)
+        if b and b.get('per_item'):
+            ratio = r['per_item'] / b['per_item']
+            ret[name] = (ratio, ratio > 1 + threshold)
+    return ret
+
+
+# IDA Analysis on the Fake Database of the Items
+def bench_ida(size, repeat, sig_dir, sig_count):
+    signame = sorted(os.path.basename(p) for p in
+                     glob.glob(os.path.join(sig_dir, 'pc', '_*_*.sig')))
+    signame = signame[:sig_count]
+    case = [('functionalize_single_instruction',
+             prepare.functionalize_single_instruction),
+            ('true_up_function_name', prepare.true_up_function_name),
+            ('register_c_main', prepare.register_c_main),
+            ('apply_function_type', prepare.apply_function_type)]
+    if signame:
+        case.extend((('estimate_single_pass',
+                      lambda: chksig.estimate_single_pass(
+                          os.path.join(sig_dir, 'pc'), signame)),
+                     ('estimate_apply',
+                      lambda: chksig.estimate_apply(signame)),
+                     ('estimate_bounded',
+                      lambda: chksig.estimate_bounded(
+                          signame, chksig.get_bound(
+                              os.path.join(sig_dir, 'pc'), signame), {}))))
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Index and Cache in the Temporary Directory (not the checkout)
+        root, _ = os.path.splitext(os.path.abspath(prepare.__file__))
+        prepare.name_index = prepare.NameIndex(
+            os.path.join(tmp, 'prepare.idx'),
+            os.path.join(os.path.dirname(root), 'name_alternate.csv'),
+            root + '.txt')
+        for name, func in case:
+            best = None
+            for i in range(repeat):
+                db = fakeida.generate(size, seed=i)
+                db.sig_dir = os.path.join(sig_dir, 'pc')
+                db.idb_path = os.path.join(tmp, 'fakeida.idb')
+                with fakeida.install(db, prepare, chksig):
+                    prepare.decl_cache = prepare.DeclarationCache(
+                        os.path.join(tmp, 'decl.json'),
+                        prepare.get_type_library())
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            result[name] = best
+        prepare.name_index.close()
+        prepare.name_index = None
+        prepare.decl_cache = None
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark.')
+    parser.add_argument('path', nargs='*', help='ELF file')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of repetitions')
+    parser.add_argument('--ida', type=int, nargs='+', metavar='ITEMS',
+                        help='benchmark IDA analysis on fake database')
+    parser.add_argument('--sig', default=chksig.get_sig_dir(
+                            os.path.abspath(chksig.__file__)),
+                        help='signature directory')
+    parser.add_argument('--sig-count', type=int, default=4,
+                        help='number of signatures to estimate')
+    parser.add_argument('--pattern', metavar='DIR',
+                        help='benchmark pattern files in the directory')
+    parser.add_argument('--synthetic', type=int, metavar='FILES',
+                        help='benchmark non-IDA code on synthetic corpus')
+    parser.add_argument('--pattern-count', type=int, default=100,
+                        help='number of synthetic pattern files')
+    parser.add_argument('--module-count', type=int, default=500,
+                        help='number of modules per synthetic pattern file')
+    parser.add_argument('--payload-size', type=int, default=1 << 18,
+                        help='size of synthetic ELF payload (bytes)')
+    parser.add_argument('--alias-density', type=float, default=0.3,
+                        help='ratio of synthetic modules with alias')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of synthetic corpus')
+    parser.add_argument('--json', help='report file of synthetic benchmark')
+    parser.add_argument('--baseline', help='baseline report to compare')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown ratio against baseline')
+    args = vars(parser.parse_args())
+    if args['pattern']:
+        file = sorted(glob.glob(os.path.join(args['pattern'], '**', '*.pat'),
+                                recursive=True))
+        if not file:
+            sys.exit('no file')
+        for name, elapsed in bench_pattern(file, args['repeat']).items():
+            print('{:28} {:10.3f} ms {:10.1f} us/file'.
+                  format(name, elapsed * 1000, elapsed / len(file) * 1000000))
+        sys.exit()
+    if args['synthetic'] is not None:
+        corpus = {k: args[k] for k in ('synthetic', 'pattern_count',
+                                       'module_count', 'payload_size',
+                                       'alias_density', 'seed')}
+        with tempfile.TemporaryDirectory() as tmp:
+            elf, pattern = generate_corpus(
+                tmp, args['synthetic'], args['pattern_count'], args['seed'],
+                args['payload_size'], args['module_count'],
+                args['alias_density'])
+            result = bench_synthetic(elf, pattern, args['repeat'])
+        report = {'version': BENCHMARK_VERSION,
+                  'python': platform.python_version(),
+                  'numpy': prepare.npy,
+                  'repeat': args['repeat'],
+                  'corpus': corpus,
+                  'result': result}
+        diff = {}
+        if args['baseline']:
+            with open(args['baseline']) as f:
+                baseline = json.load(f)
+            diff = compare(result, baseline, args['threshold'])
+            report['baseline'] = {'file': args['baseline'],
+                                  'threshold': args['threshold'],
+                                  'ratio': {k: v for k, (v, _)
+                                            in diff.items()},
+                                  'regression': sorted(k for k, (_, r)
+                                                       in diff.items() if r)}
+        for name, r in result.items():
+            ratio, regression = diff.get(name, (None, False))
+            print('{:18} {:8} {:10.3f} ms {:10.1f} us/item{}{}'.
+                  format(name, r['count'], r['time'] * 1000,
+                         r['per_item'] * 1000000,
+                         '' if ratio is None else ' {:6.2f}x'.format(ratio),
+                         ' REGRESSION' if regression else ''))
+        if args['json']:
+            with open(args['json'], 'w', newline='\n') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        sys.exit(1 if any(r for _, r in diff.values()) else 0)
+    if args['ida']:
+        for size in args['ida']:
+            for name, elapsed in bench_ida(size, args['repeat'], args['sig'],
+                                           args['sig_count']).items():
+                print('{:32} {:8} {:10.3f} ms {:10.3f} us/item'.
+                      format(name, size, elapsed * 1000,
+                             elapsed / size * 1000000))
+        sys.exit()
+    file = [p for arg in args['path'] for p in glob.glob(arg)
+            if os.path.isfile(p)]
+    if not file:
+        sys.exit('no file')
+    for name, elapsed in bench_elf(file, args['repeat']).items():
+        print('{:24} {:10.3f} ms {:10.1f} us/file'.
+              format(name, elapsed * 1000, elapsed / len(file) * 1000000))
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import importlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+try:
+    importlib.reload(prepare)
+except NameError:
+    import prepare
+try:
+    importlib.reload(flirt)
+except NameError:
+    import flirt
+
+
+# Architecture Label of the Distribution: (endianness, bits)
+# The ISA variant is not assumed from the label, since the old toolchains
+# of the same label may use the other ABI.
+LABEL = {'armv4l':        ('little', 32),
+         'armv4tl':       ('little', 32),
+         'armv5l':        ('little', 32),
+         'armv6l':        ('little', 32),
+         'armv7l':        ('little', 32),
+         'm68k':          ('big',    32),
+         'mips':          ('big',    32),
+         'mipsel':        ('little', 32),
+         'mips64':        ('big',    64),
+         'i486':          ('little', 32),
+         'i586':          ('little', 32),
+         'i686':          ('little', 32),
+         'x86_64':        ('little', 64),
+         'powerpc':       ('big',    32),
+         'powerpc-440fp': ('big',    32),
+         'sh4':           ('little', 32),
+         'sh2eb':         ('big',    32),
+         'sh2elf':        ('big',    32)}
+AR_HEADER = struct.Struct('16s12s6s6s8s10s2s')
+AR_MAGIC = b'!<arch>\n'
+EF_ARM_EABIMASK = 0xff000000
+EF_MIPS_ABI2 = 0x20
+FAMILY_FILE = 'family.json'
+ISA_FILE = 'isa.json'
+RE_NAME = re.compile(r'_(lib[^_]+)_([^-]+)-([\d.]+)-(.+)\.(?:pat|sig)')
+RE_VERSION = (('gcc', re.compile(rb'GCC: \([^)]*\) (\d+(?:\.\d+)+)')),
+              ('uClibc', re.compile(rb'uClibc[- ]v?(\d+(?:\.\d+){2,3})')))
+# Distribution whose Version is the Version of uClibc (uclibc.org binaries)
+UCLIBC_DISTRIBUTION = ('firmware',)
+
+
+# Attributes of the Signature from the Name and the Header
+# isa: ISA variant of the signature recorded in isa.json, None if unknown
+# uclibc: version of uClibc of the distribution, None if unknown
+def get_entry(file, isa=None):
+    entry = {'library': None, 'distribution': None, 'version': None,
+             'label': None, 'variant': None, 'endian': None, 'bits': None,
+             'isa': isa, 'uclibc': None,
+             'functions': flirt.load_header(file).n_functions}
+    m = RE_NAME.fullmatch(os.path.basename(file))
+    if m:
+        entry['library'], entry['distribution'], entry['version'], rest = \
+            m.groups()
+        for label in sorted(LABEL, key=len, reverse=True):
+            if rest == label or rest.startswith(label + '-'):
+                entry['label'] = label
+                entry['variant'] = rest[len(label) + 1:] or None
+                entry['endian'], entry['bits'] = LABEL[label]
+                break
+        if entry['distribution'] in UCLIBC_DISTRIBUTION:
+            entry['uclibc'] = entry['version']
+    return entry
+
+
+# Signature Catalog of the CPU Directory
+def get_catalog(sig_dir):
+    catalog = {}
+    isa = load_isa(sig_dir)
+    for path in sorted(glob.glob(os.path.join(sig_dir, '_*_*.sig'))):
+        name = os.path.basename(path)
+        try:
+            catalog[name] = get_entry(path, isa.get(name))
+        except flirt.SignatureError as e:
+            print(path, e, file=sys.stderr)
+    return catalog
+
+
+# Family Hierarchy of the Signatures
+# The signatures of the same library and architecture label are grouped
+# into the family, further into the family of each distribution, and the
+# versions are halved into the families of the version range.
+# {family: [child]} where the child is the family or the signature
+def get_family(signame):
+    group = {}
+    for n in sorted(signame):
+        m = RE_NAME.fullmatch(n)
+        if m:
+            library, distribution, version, label = m.groups()
+            group.setdefault((library, label), {}). \
+                setdefault(distribution, []).append((version, n))
+    family = {}
+
+    def split(library, distribution, label, member):
+        if len(member) <= 2:
+            return [n for _, n in member]
+        child = []
+        half = (len(member) + 1) // 2
+        for part in (member[:half], member[half:]):
+            if len(part) < 2:
+                child.extend(n for _, n in part)
+                continue
+            f = 'family_{}_{}-{}-{}-{}.sig'.format(
+                library, distribution, part[0][0], part[-1][0], label)
+            family[f] = split(library, distribution, label, part)
+            child.append(f)
+        return child
+
+    for (library, label), member in sorted(group.items()):
+        if sum(len(v) for v in member.values()) < 2:
+            continue
+        child = []
+        for distribution, name in sorted(member.items()):
+            name.sort(key=lambda v: tuple(int(s) for s in v[0].split('.')
+                                          if s.isdigit()))
+            if len(member) < 2:
+                child.extend(split(library, distribution, label, name))
+            elif len(name) < 2:
+                child.extend(n for _, n in name)
+            else:
+                f = 'family_{}_{}-{}.sig'.format(library, distribution, label)
+                family[f] = split(library, distribution, label, name)
+                child.append(f)
+        family['family_{}_{}.sig'.format(library, label)] = child
+    return family
+
+
+# Signatures under the Family
+def get_member(family, name):
+    ret = set()
+    stack = [name]
+    while stack:
+        n = stack.pop()
+        if n in family:
+            stack.extend(family[n])
+        else:
+            ret.add(n)
+    return ret
+
+
+# Hierarchy File of the Family Signatures in the CPU Directory
+def load_family(sig_dir):
+    try:
+        with open(os.path.join(sig_dir, FAMILY_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# ISA Variant of the ELF Header (ARM and MIPS), None if it has no variant
+def get_isa(header):
+    if header['machine'] == 40:
+        return 'eabi' if header['flags'] & EF_ARM_EABIMASK else 'oabi'
+    if header['machine'] == 8:
+        return 'mips64' if header['bits'] == 64 \
+            or header['flags'] & EF_MIPS_ABI2 else 'mips32'
+    return None
+
+
+# ISA Variant of the Objects in the Library (ar archive)
+# It returns None unless all the ELF objects have the same variant.
+def get_library_isa(file):
+    isa = set()
+    with open(file, 'rb') as f:
+        if f.read(len(AR_MAGIC)) != AR_MAGIC:
+            return None
+        while True:
+            buf = f.read(AR_HEADER.size)
+            if len(buf) < AR_HEADER.size:
+                break
+            try:
+                size = int(AR_HEADER.unpack(buf)[5])
+            except ValueError:
+                return None
+            offset = f.tell()
+            header = prepare.read_elf_header(f.read(min(size, 64)))
+            if header:
+                isa.add(get_isa(header))
+            f.seek(offset + size + size % 2)
+    return isa.pop() if len(isa) == 1 else None
+
+
+# ISA File of the Signatures in the CPU Directory
+# {signature: ISA variant or None}
+def load_isa(sig_dir):
+    try:
+        with open(os.path.join(sig_dir, ISA_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# ISA Variant of the Signature from its Modules, None if it is unknown
+# ARM: uClibc defines the run-time helpers "__aeabi_*" only for EABI.
+# MIPS: the stack pointer is adjusted by "daddiu" for the 64-bit ABI and by
+# "addiu" for the 32-bit ABI at the start of the functions.
+def get_signature_isa(file, cpu, entry):
+    if cpu == 'arm' and entry['library'] == 'libc':
+        stack = [flirt.load(file).root]
+        while stack:
+            node = stack.pop()
+            for m in node.modules:
+                if any(n.startswith('__aeabi_') for _, n, _ in m.public):
+                    return 'eabi'
+            stack.extend(node.children)
+        return 'oabi'
+    if cpu == 'mips' and entry['endian']:
+        count = {'mips32': 0, 'mips64': 0}
+        stack = [(flirt.load(file).root, b'')]
+        while stack:
+            node, lead = stack.pop()
+            if node.modules:
+                for i in range(0, len(lead) - 3, 4):
+                    w = int.from_bytes(lead[i:i + 4], entry['endian'])
+                    if w >> 16 == 0x27BD:
+                        count['mips32'] += len(node.modules)
+                    elif w >> 16 == 0x67BD:
+                        count['mips64'] += len(node.modules)
+            stack.extend((c, lead + c.value.to_bytes(c.length, 'big'))
+                         for c in node.children)
+        if count['mips32'] != count['mips64']:
+            return max(count, key=count.get)
+    return None
+
+
+# ISA Variants of the Signatures in the CPU Directory from their Modules
+# The signature of libgcc has the variant of libc of the same toolchain.
+def scan_isa(sig_dir):
+    cpu = os.path.basename(os.path.normpath(sig_dir))
+    catalog = get_catalog(sig_dir)
+    isa = {}
+    for name, entry in catalog.items():
+        if entry['library'] != 'libgcc':
+            isa[name] = get_signature_isa(os.path.join(sig_dir, name), cpu,
+                                          entry)
+    for name, entry in catalog.items():
+        if entry['library'] == 'libgcc':
+            isa[name] = isa.get('_libc_' + name[len('_libgcc_'):])
+    return isa
+
+
+# Pre-Scan of the Sample (ELF header and version strings)
+def prescan(file):
+    info = prepare.get_elf_info(file)
+    if not info or info['machine'] not in prepare.CPU:
+        return None
+    scan = {'cpu': prepare.CPU[info['machine']],
+            'endian': 'little' if info['endian'] == '<' else 'big',
+            'bits': info['bits'],
+            'flags': info['flags'],
+            'isa': get_isa(info),
+            'version': [],
+            'uclibc': set()}
+    with open(file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for name, r in RE_VERSION:
+                for v in sorted(set(m.group(1) for m in r.finditer(buf))):
+                    scan['version'].append(name + ' ' + v.decode())
+                    if name == 'uClibc':
+                        scan['uclibc'].add(v.decode())
+    return scan
+
+
+# Is the Signature Compatible with the Sample
+# The signature whose label is unknown is always compatible, and the ISA
+# variant and the version of uClibc are compared only if they are known for
+# both the signature and the sample.
+def is_compatible(entry, scan):
+    if entry['label'] is None:
+        return True
+    if entry['endian'] != scan['endian']:
+        return False
+    if entry['uclibc'] and scan['uclibc'] \
+            and entry['uclibc'] not in scan['uclibc']:
+        return False
+    if entry['isa'] and scan['isa']:
+        return entry['isa'] == scan['isa']
+    return entry['bits'] == scan['bits']
+
+
+# Compatible Signatures of the Catalog
+# The signatures of the same version of uClibc as the sample come first.
+def select(catalog, scan):
+    return sorted((n for n, e in catalog.items() if is_compatible(e, scan)),
+                  key=lambda n: (catalog[n]['uclibc'] not in scan['uclibc'],
+                                 n))
+
+
+# Shortlist of the Compatible Signatures
+# It returns None if the sample can not be scanned.
+def get_shortlist(file, sig_dir, cpu=None):
+    scan = prescan(file) if os.path.isfile(file) else None
+    if not scan or (cpu and cpu != scan['cpu']):
+        return None
+    return select(get_catalog(os.path.join(sig_dir, scan['cpu'])), scan)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Signature Catalog.')
+    parser.add_argument('path', nargs='*', help='ELF file')
+    parser.add_argument('--sig', default=os.path.join(
+                            os.path.dirname(os.path.abspath(__file__)),
+                            'sig'),
+                        help='signature directory')
+    parser.add_argument('--isa', action='store_true',
+                        help='write ISA variants of signatures to isa.json')
+    args = vars(parser.parse_args())
+    if args['isa']:
+        for cpu in sorted(os.listdir(args['sig'])):
+            sig_dir = os.path.join(args['sig'], cpu)
+            if not os.path.isdir(sig_dir):
+                continue
+            isa = scan_isa(sig_dir)
+            isa.update((n, v) for n, v in load_isa(sig_dir).items()
+                       if v and n in isa)
+            prepare.write_atomic(os.path.join(sig_dir, ISA_FILE), json.dumps(
+                isa, indent=2, sort_keys=True).encode())
+    elif not args['path']:
+        for cpu in sorted(os.listdir(args['sig'])):
+            catalog = get_catalog(os.path.join(args['sig'], cpu))
+            for name, e in catalog.items():
+                print(cpu, name, e['label'], e['variant'] or '-', e['endian'],
+                      e['bits'], e['isa'] or '-', e['functions'])
+    for path in args['path']:
+        scan = prescan(path)
+        if not scan:
+            print(path, 'not targeted')
+            continue
+        catalog = get_catalog(os.path.join(args['sig'], scan['cpu']))
+        shortlist = select(catalog, scan)
+        print(path, scan['cpu'], scan['endian'], scan['bits'],
+              scan['isa'] or '-', ', '.join(scan['version']) or '-',
+              '{}/{}'.format(len(shortlist), len(catalog)))
+        for name in shortlist:
+            print(' ', name)
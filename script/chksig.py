@@ -7,19 +7,22 @@
 
 
 import argparse
+import collections
+import concurrent.futures
+import functools
 import glob
 import importlib
 import json
+import math
 import os
 import re
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 try:
-    import elftools.elf.elffile
-except ImportError:
-    pyelftools = False
-else:
-    pyelftools = True
-try:
+    import idautils
     import idc
 except ImportError:
     idapro = False
@@ -29,27 +32,31 @@ try:
     importlib.reload(prepare)
 except NameError:
     import prepare
+try:
+    importlib.reload(catalog)
+except NameError:
+    import catalog
+try:
+    importlib.reload(flirt)
+except NameError:
+    import flirt
+try:
+    importlib.reload(results)
+except NameError:
+    import results
+try:
+    importlib.reload(triage)
+except NameError:
+    import triage
+
+
+LIBNAME = ('_libc_', '_libgcc_')
 
 
 # True if Library Identification is Necessary
-if pyelftools:
-    def is_strip(file):
-        ret = False
-        with open(file, 'rb') as f:
-            try:
-                elf = elftools.elf.elffile.ELFFile(f)
-                ret = True
-                for section in elf.iter_sections():
-                    if isinstance(section,
-                                  elftools.elf.sections.SymbolTableSection):
-                        ret = False
-                        break
-            except elftools.common.exceptions.ELFParseError:
-                pass
-        return ret
-else:
-    def is_strip(file):
-        return True
+def is_strip(file, info=None):
+    info = info or prepare.get_elf_info(file)
+    return bool(info) and not info['symtab'] and not info['dynsym']
 
 
 def is_result(file):
@@ -62,12 +69,398 @@ def is_result(file):
     return ret
 
 
+# Library of the Greatest Estimate
+def get_result(estimate):
+    result = {}
+    signame = sorted(estimate)
+    for ln in LIBNAME:
+        name = None
+        count = 1
+        for n in signame:
+            if n.startswith(ln) and count < estimate[n]:
+                name = n
+                count = estimate[n]
+        result[ln] = name
+    return result
+
+
+# Bytes and Function Starts of the Segments
+# [(bytes of the segment, [offsets of the function starts])]
+def get_segment():
+    ret = []
+    seg = idc.get_first_seg()
+    while seg != idc.BADADDR:
+        st = idc.get_segm_start(seg)
+        ed = idc.get_segm_end(seg)
+        buf = idc.get_bytes(st, ed - st)
+        if buf:
+            ret.append((buf, [ea - st for ea in idautils.Functions(st, ed)]))
+        seg = idc.get_next_seg(seg)
+    return ret
+
+
+# Estimate Signatures by a Single Pass of the Merged Signature
+# Each signature is matched at the start of the same functions as
+# estimate_apply(), so the estimates are the same as long as applying the
+# signature creates no function.
+def estimate_single_pass(sig_dir, signame):
+    signature = {n: flirt.load(os.path.join(sig_dir, n)) for n in signame}
+    ret = dict.fromkeys(signame, 0)
+    ret.update(flirt.count_function(flirt.merge(signature), get_segment()))
+    return ret
+
+
+# Upper Bounds of the Estimates of the Signatures on the Database
+def get_bound(sig_dir, signame):
+    signature = {n: flirt.load(os.path.join(sig_dir, n)) for n in signame}
+    return flirt.get_bound(signature, get_segment())
+
+
+# Estimate by Applying Each Signature and Counting Library Functions
+# timing: {signature: {time, functions, cleared, lib, renamed}}
+def estimate_apply(signame, timing=None):
+    ret = {}
+    for name in sorted(signame):
+        start = time.perf_counter()
+        cleared = 0
+        funcname = {}
+        for ea in idautils.Functions():
+            flags = idc.get_func_flags(ea)
+            if flags != -1 and flags & idc.FUNC_LIB:
+                idc.set_func_flags(ea, flags & ~idc.FUNC_LIB)
+                cleared += 1
+            if timing is not None:
+                funcname[ea] = idc.get_name(ea)
+        idc.auto_wait()
+        idc.plan_to_apply_idasgn(name)
+        idc.auto_wait()
+        count = 0
+        function = 0
+        renamed = 0
+        for ea in idautils.Functions():
+            function += 1
+            flags = idc.get_func_flags(ea)
+            if flags != -1 and flags & idc.FUNC_LIB:
+                count += 1
+            if timing is not None and \
+                    funcname.get(ea) != idc.get_name(ea):
+                renamed += 1
+        ret[name] = count
+        if timing is not None:
+            timing[name] = {'time': time.perf_counter() - start,
+                            'functions': function, 'cleared': cleared,
+                            'lib': count, 'renamed': renamed}
+    return ret
+
+
+# Estimate Signatures in the Order of the Upper Bound
+# The signature is skipped when it can not beat the leader of its library,
+# since the result needs more than 1 function and the former name wins a tie.
+# The signatures of the other libraries are never the result.
+def estimate_bounded(signame, bound, estimate, func=estimate_apply):
+    ret = {}
+    skip = {}
+    for n in signame:
+        if not n.startswith(LIBNAME):
+            skip[n] = {'reason': 'library'}
+    for ln in LIBNAME:
+        leader = None
+        count = 1
+        for n in sorted(estimate):
+            if n.startswith(ln) and count < estimate[n]:
+                leader = n
+                count = estimate[n]
+        name = sorted((n for n in signame if n.startswith(ln)),
+                      key=lambda n: (n in bound, -bound.get(n, 0), n))
+        for n in name:
+            b = bound.get(n)
+            if b is not None and (b < count or b == count and
+                                  (leader is None or n > leader)):
+                skip[n] = {'reason': 'bound', 'bound': b, 'leader': leader,
+                           'count': count}
+                continue
+            ret.update(func([n]))
+            if count < ret[n] or count == ret[n] and leader and n < leader:
+                leader = n
+                count = ret[n]
+    return ret, skip
+
+
+# Estimate Signatures by Descending the Family Hierarchy
+# The top level of each library is applied first, and then only the children
+# of the family of the greatest estimate, down to the signatures.
+# The family without a rival is not applied, and the signatures under the
+# other families are skipped.
+def estimate_family(signame, family, estimate, func=estimate_apply):
+    ret = {}
+    skip = {}
+    member = {f: catalog.get_member(family, f) & signame for f in family}
+    child = set(n for c in family.values() for n in c)
+    top = [n for n in sorted(family) if n not in child and member[n]]
+    top += [n for n in sorted(signame) if n not in child]
+    for n in signame:
+        if not n.startswith(LIBNAME):
+            skip[n] = {'reason': 'library'}
+    for ln in LIBNAME:
+        level = [n for n in top
+                 if any(m.startswith(ln) for m in member.get(n, (n,)))]
+        while level:
+            group = [n for n in level if n in family]
+            name = [n for n in level if n not in estimate and n not in ret
+                    and (n not in family or len(group) > 1)]
+            if name:
+                ret.update(func(name))
+            if not group:
+                break
+            best = min(group, key=lambda n: (-ret.get(n, estimate.get(n, 0)),
+                                             n))
+            for f in group:
+                if f != best:
+                    for n in member[f]:
+                        skip[n] = {'reason': 'family', 'family': best}
+            level = [n for n in family[best]
+                     if member.get(n) or n in signame]
+    return ret, skip
+
+
+# Execute IDA Pro in a Scratch Directory
+def exec_ida_scratch(idapro, script, path, file, *args,
+                     timeout=None, scratch=None, timing=None):
+    basename, _ = os.path.splitext(os.path.basename(script))
+    tmp = tempfile.mkdtemp(prefix=basename + '_', dir=scratch)
+    try:
+        sample = os.path.join(tmp, os.path.basename(path))
+        try:
+            os.link(path, sample)
+        except OSError:
+            shutil.copyfile(path, sample)
+        root, _ = os.path.splitext(sample)
+        tmpfile = root + '_' + basename + '.json'
+        if os.path.exists(file):
+            shutil.copyfile(file, tmpfile)
+        ret = prepare.exec_ida(idapro, script, sample, *args, timeout=timeout,
+                               timing=timing)
+        if os.path.exists(tmpfile):
+            shutil.move(tmpfile, file)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return ret
+
+
+# Triage Record of a File
+# skip: None if targeted, otherwise format, machine, strip or entropy
+def get_triage(path, args, record=None):
+    if record is None:
+        info = prepare.get_elf_info(path)
+        record = {'bits': info and info['bits'],
+                  'machine': info and info['machine'],
+                  'strip': is_strip(path, info),
+                  'static': info and info['static'],
+                  'entropy': None}
+        if args['cache'] or args['results']:
+            record['sha256'] = triage.get_hash(path)
+            record['size'] = os.path.getsize(path)
+    if not record['bits']:
+        record['skip'] = 'format'
+    elif not (args['ignore_machine']
+              or record['machine'] in (3, 8, 20, 40, 42, 62)):
+        record['skip'] = 'machine'
+    elif not (args['ignore_strip'] or record['strip']):
+        record['skip'] = 'strip'
+    else:
+        record['skip'] = None
+        if not args['ignore_entropy']:
+            if record['entropy'] is None:
+                record['entropy'] = prepare.entropy(path)
+            if record['entropy'] >= prepare.ENTROPY_THRESHOLD:
+                record['skip'] = 'entropy'
+    return record
+
+
+# Check Signature of a File
+# resume: result exists, ignore: not targeted, done: checked,
+# fail: no result, timeout: IDA Pro timed out
+def check(path, args, idapro, record=None):
+    script = os.path.abspath(__file__)
+    root, _ = os.path.splitext(script)
+    basename = os.path.basename(root)
+    root, _ = os.path.splitext(os.path.abspath(path))
+    file = root + '_' + basename + '.json'
+    if args['force'] and os.path.exists(file):
+        os.remove(file)
+    if is_result(file):
+        return 'resume', record
+    record = get_triage(path, args, record)
+    if record['skip']:
+        with open(file, 'w', newline='\n') as f:
+            json.dump({'result': {}}, f, indent=2, sort_keys=True)
+        return 'ignore', record
+    if args['headless']:
+        signame = None
+        if args['shortlist']:
+            signame = catalog.get_shortlist(path, args['sig'])
+        start = time.perf_counter()
+        estimate = flirt.estimate(path, args['sig'], signame)
+        libjson = {'estimate': estimate, 'result': get_result(estimate)}
+        if args['timing']:
+            libjson['timing'] = {'headless': time.perf_counter() - start}
+        with open(file, 'w', newline='\n') as f:
+            json.dump(libjson, f, indent=2, sort_keys=True)
+        return 'done', record
+    opt = ('--single-pass',) if args['single_pass'] else ()
+    if args['shortlist']:
+        opt += ('--shortlist',)
+    if args['bounded']:
+        opt += ('--bounded',)
+    if args['exhaustive']:
+        opt += ('--exhaustive',)
+    if args['flat']:
+        opt += ('--flat',)
+    timing = None
+    if args['timing']:
+        opt += ('--timing',)
+        timing = []
+    try:
+        if args['jobs']:
+            exec_ida_scratch(idapro[record['bits']], script, path, file, *opt,
+                             timeout=args['timeout'], scratch=args['scratch'],
+                             timing=timing)
+        else:
+            prepare.exec_ida(idapro[record['bits']], script, path, *opt,
+                             timeout=args['timeout'], timing=timing)
+    except subprocess.TimeoutExpired:
+        return 'timeout', record
+    finally:
+        if timing:
+            save_process_timing(file, timing)
+    return 'done' if is_result(file) else 'fail', record
+
+
+# Append Launch and Exit Time of IDA Pro to "timing" of the JSON
+def save_process_timing(file, process):
+    libjson = {}
+    if os.path.exists(file):
+        with open(file) as f:
+            libjson = json.load(f)
+    libjson.setdefault('timing', {}).setdefault('process', []).extend(process)
+    with open(file, 'w', newline='\n') as f:
+        json.dump(libjson, f, indent=2, sort_keys=True)
+
+
+# Group the Files of the Same Content
+# The files are compared by the size, and the SHA-256 (from the triage record
+# if it exists) only if the size is the same.
+# {representative: [duplicate]}
+def group_duplicate(path, record=None):
+    record = record or {}
+    bucket = {}
+    for p in path:
+        try:
+            bucket.setdefault(os.path.getsize(p), []).append(p)
+        except OSError:
+            bucket.setdefault(None, []).append(p)
+    group = {}
+    for size, member in bucket.items():
+        if size is None or len(member) == 1:
+            group.update((p, []) for p in member)
+            continue
+        content = {}
+        for p in member:
+            rec = record.get(p)
+            h = rec and rec.get('sha256') or triage.get_hash(p)
+            content.setdefault(h, []).append(p)
+        for p in content.values():
+            group[p[0]] = p[1:]
+    return group
+
+
+# Copy the JSON of the Representative to the Duplicates
+# "duplicate" of the JSON is the list of the files of the same content.
+def fan_out(path, duplicate):
+    file = results.get_json_file(path)
+    if not duplicate or not os.path.exists(file):
+        return
+    with open(file) as f:
+        libjson = json.load(f)
+    libjson['duplicate'] = sorted(os.path.abspath(p)
+                                  for p in [path] + duplicate)
+    for p in [path] + duplicate:
+        with open(results.get_json_file(p), 'w', newline='\n') as f:
+            json.dump(libjson, f, indent=2, sort_keys=True)
+
+
+# Store the JSON of the File into the Results Store
+# The JSON which has "result" is removed unless keep is True.
+def store_result(store, path, record, keep=True):
+    file = results.get_json_file(path)
+    if not os.path.exists(file):
+        return
+    with open(file) as f:
+        libjson = json.load(f)
+    store.store(path, libjson, record and record.get('sha256'))
+    if not keep and 'result' in libjson:
+        os.remove(file)
+
+
+# Percentile of the Sorted Values (nearest rank)
+def percentile(value, p):
+    return value[min(max(math.ceil(len(value) * p / 100) - 1, 0),
+                     len(value) - 1)]
+
+
+# Timing Report of the JSON Files
+# {(kind, key): [seconds]}, kind: signature, cpu, process or init_idb
+def get_timing_report(file):
+    report = {}
+    for js in file:
+        try:
+            with open(js) as f:
+                timing = json.load(f).get('timing', {})
+        except (OSError, ValueError):
+            continue
+        ida = timing.get('ida', {})
+        for name, t in ida.get('signature', {}).items():
+            report.setdefault(('signature', name), []).append(t['time'])
+        if ida:
+            report.setdefault(('cpu', ida.get('cpu')), []).append(
+                sum(ida.get('phase', {}).values()))
+        for t in timing.get('process', ()):
+            report.setdefault(('process', 'ida'), []).append(t['time'])
+        if 'headless' in timing:
+            report.setdefault(('process', 'headless'), []).append(
+                timing['headless'])
+        for name, t in timing.get('init_idb', {}).items():
+            report.setdefault(('init_idb', name), []).append(t)
+    return report
+
+
+# Print Percentile Latencies of the Timing Report
+def print_timing_report(report):
+    print('{:10} {:48} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+        'kind', 'name', 'count', 'p50', 'p90', 'p99', 'max'))
+    for (kind, name), value in sorted(report.items(),
+                                      key=lambda x: (x[0][0], str(x[0][1]))):
+        value = sorted(value)
+        print('{:10} {:48} {:6} {:10.3f} {:10.3f} {:10.3f} {:10.3f}'.format(
+            kind, str(name), len(value), percentile(value, 50),
+            percentile(value, 90), percentile(value, 99), value[-1]))
+
+
+# Default Signature Directory of Headless Mode
+def get_sig_dir(script):
+    dir = os.path.dirname(script)
+    for d in (os.path.join(dir, 'sig'),
+              os.path.join(dir, os.pardir, 'deliverable', 'sig')):
+        if os.path.isdir(d):
+            return os.path.abspath(d)
+    return os.path.join(dir, 'sig')
+
+
 if __name__ == '__main__':
     script = os.path.abspath(__file__)
     root, _ = os.path.splitext(script)
     basename = os.path.basename(root)
     if idapro:
-        libname = ('_libc_', '_libgcc_')
         # Signature
         name = get_inf_attr(INF_PROCNAME)
         if name.lower().startswith('arm'):
@@ -87,6 +480,11 @@ if __name__ == '__main__':
         signame = set(os.path.basename(p)
                       for p in glob.glob(os.path.join(dir,
                                                       'sig', cpu, '_*_*.sig')))
+        if '--shortlist' in idc.ARGV:
+            shortlist = catalog.get_shortlist(idc.get_input_file_path(),
+                                              os.path.join(dir, 'sig'), cpu)
+            if shortlist is not None:
+                signame &= set(shortlist)
         # Read JSON
         root, _ = os.path.splitext(os.path.abspath(get_idb_path()))
         file = root + '_' + basename + '.json'
@@ -101,41 +499,73 @@ if __name__ == '__main__':
             if diff:
                 for n in diff:
                     del libjson['estimate'][n]
+                libjson.pop('skip', None)
             elif 'result' in libjson:
                 edit = False
         else:
             libjson['estimate'] = {}
+        skip = libjson.pop('skip', {})
+        family = {}
+        if '--flat' not in idc.ARGV:
+            family = catalog.load_family(os.path.join(dir, 'sig', cpu))
+        for n in frozenset(libjson.get('family', {})) - frozenset(family):
+            del libjson['family'][n]
+            edit = True
+        for n in frozenset(skip) - signame:
+            del skip[n]
+            edit = True
+        # Timing
+        timing = None
+        apply = estimate_apply
+        if '--timing' in idc.ARGV:
+            timing = {'cpu': cpu, 'phase': {}, 'signature': {}}
+            apply = functools.partial(estimate_apply,
+                                      timing=timing['signature'])
+            start = time.perf_counter()
+            idc.auto_wait()
+            timing['phase']['auto_wait'] = time.perf_counter() - start
         # Apply Signature
-        diff = signame - frozenset(libjson['estimate'])
+        diff = signame - frozenset(libjson['estimate']) - frozenset(skip)
         if diff:
             # Estimation
-            for name in sorted(diff):
-                for ea in Functions():
-                    flags = get_func_flags(ea)
-                    if flags != -1 and flags & FUNC_LIB:
-                        set_func_flags(ea, flags & ~FUNC_LIB)
-                auto_wait()
-                plan_to_apply_idasgn(name)
-                auto_wait()
-                count = 0
-                for ea in Functions():
-                    flags = get_func_flags(ea)
-                    if flags != -1 and flags & FUNC_LIB:
-                        count += 1
-                libjson['estimate'][name] = count
+            start = time.perf_counter()
+            if '--single-pass' in idc.ARGV:
+                libjson['estimate'].update(
+                    estimate_single_pass(os.path.join(dir, 'sig', cpu), diff))
+            elif '--exhaustive' in idc.ARGV:
+                libjson['estimate'].update(apply(diff))
+            elif '--bounded' in idc.ARGV:
+                bound = get_bound(os.path.join(dir, 'sig', cpu), diff)
+                estimate, ret = estimate_bounded(diff, bound,
+                                                 libjson['estimate'], apply)
+                libjson['estimate'].update(estimate)
+                skip.update(ret)
+            elif family:
+                estimate, ret = estimate_family(
+                    diff, family,
+                    dict(libjson.get('family', {}), **libjson['estimate']),
+                    apply)
+                for n, v in estimate.items():
+                    if n in family:
+                        libjson.setdefault('family', {})[n] = v
+                    else:
+                        libjson['estimate'][n] = v
+                skip.update(ret)
+            else:
+                libjson['estimate'].update(apply(diff))
+            if timing is not None:
+                timing['phase']['estimate'] = time.perf_counter() - start
+            for n in frozenset(skip) & frozenset(libjson['estimate']):
+                del skip[n]
+            edit = True
+        if skip:
+            libjson['skip'] = skip
+        if timing is not None:
+            libjson.setdefault('timing', {})['ida'] = timing
             edit = True
         # Result
         if edit:
-            libjson['result'] = {}
-            signame = sorted(signame)
-            for ln in libname:
-                name = None
-                estimate = 1
-                for n in signame:
-                    if n.startswith(ln) and estimate < libjson['estimate'][n]:
-                        name = n
-                        estimate = libjson['estimate'][n]
-                libjson['result'][ln] = name
+            libjson['result'] = get_result(libjson['estimate'])
             # Update JSON
             with open(file, 'w', newline='\n') as f:
                 json.dump(libjson, f, indent=2, sort_keys=True)
@@ -155,30 +585,123 @@ if __name__ == '__main__':
                             help='ignore machine')
         parser.add_argument('--ignore-strip', action='store_true',
                             help='ignore strip')
+        parser.add_argument('--headless', action='store_true',
+                            help='estimate signature without IDA Pro')
+        parser.add_argument('--sig', default=get_sig_dir(script),
+                            help='signature directory of headless mode')
+        parser.add_argument('--single-pass', action='store_true',
+                            help='estimate all signatures in a single pass')
+        parser.add_argument('--shortlist', action='store_true',
+                            help='apply only compatible signatures')
+        parser.add_argument('--bounded', action='store_true',
+                            help='skip signatures by upper bound')
+        parser.add_argument('--exhaustive', action='store_true',
+                            help='apply all signatures one by one')
+        parser.add_argument('--flat', action='store_true',
+                            help='apply all signatures one by one')
+        parser.add_argument('--timing', action='store_true',
+                            help='record timing in JSON')
+        parser.add_argument('--report', action='store_true',
+                            help='print timing report of the JSON files')
+        parser.add_argument('-j', '--jobs', type=int, default=0,
+                            help='number of parallel analyses')
+        parser.add_argument('--timeout', type=float,
+                            help='timeout of IDA Pro per file (seconds)')
+        parser.add_argument('--scratch',
+                            help='parent directory of scratch directories')
+        parser.add_argument('--idapro', help='IDA Pro executable')
+        parser.add_argument('--cache', help='triage cache file')
+        parser.add_argument('--results', help='results store file')
+        parser.add_argument('--no-dedup', action='store_true',
+                            help='check files of the same content one by one')
+        parser.add_argument('--no-json', action='store_true',
+                            help='remove JSON stored in results store')
+        parser.add_argument('--cache-age', type=float, metavar='DAYS',
+                            help='evict triage records not used for the days')
         args = vars(parser.parse_args())
         if args.pop('ignore'):
             args.update({'ignore_entropy': True,
                          'ignore_machine': True,
                          'ignore_strip':   True})
+        if args['report']:
+            print_timing_report(get_timing_report(
+                p if p.endswith('_' + basename + '.json')
+                else os.path.splitext(p)[0] + '_' + basename + '.json'
+                for arg in args['path'] for p in glob.glob(arg)))
+            sys.exit()
 
         # File/Folder
-        idapro32, idapro64 = prepare.get_idapro_path()
-        for arg in args['path']:
-            for path in glob.glob(arg):
-                root, _ = os.path.splitext(os.path.abspath(path))
-                file = root + '_' + basename + '.json'
-                if args['force'] and os.path.exists(file):
-                    os.remove(file)
-                if not is_result(file):
-                    bits, machine = prepare.get_elf_attr(path)
-                    if bits and (args['ignore_machine']
-                                 or machine in (3, 8, 20, 40, 42, 62)) \
-                        and (args['ignore_strip'] or is_strip(path)) \
-                        and (args['ignore_entropy']
-                             or not prepare.is_packed(path)):
-                        idapro = {32: idapro32, 64: idapro64}[bits]
-                        prepare.exec_ida(idapro, script, path)
-                    else:
-                        with open(file, 'w', newline='\n') as f:
-                            json.dump({'result': {}},
-                                      f, indent=2, sort_keys=True)
+        if args['headless']:
+            idapro = None
+        elif args['idapro']:
+            idapro = dict.fromkeys((32, 64), args['idapro'])
+        else:
+            idapro = dict(zip((32, 64), prepare.get_idapro_path()))
+        path = [p for arg in args['path'] for p in glob.glob(arg)]
+        cache = triage.TriageCache(args['cache']) if args['cache'] else None
+        if cache and args['cache_age'] is not None:
+            cache.evict(args['cache_age'] * 86400)
+        record = cache.lookup(path) if cache else {}
+        store = None
+        stored = set()
+        if args['results']:
+            store = results.ResultStore(args['results'])
+            if not args['force']:
+                stored = store.lookup(path)
+        path = [p for p in path if p not in stored]
+        if args['no_dedup']:
+            group = dict.fromkeys(path, [])
+        else:
+            group = group_duplicate(path, record)
+        if args['jobs']:
+            start = time.perf_counter()
+            status = collections.Counter(resume=len(stored))
+            with concurrent.futures.ProcessPoolExecutor(args['jobs']) \
+                    as executor:
+                future = {executor.submit(check, p, args, idapro,
+                                          record.get(p)): p
+                          for p in group}
+                for fut in concurrent.futures.as_completed(future):
+                    p = future[fut]
+                    try:
+                        ret, rec = fut.result()
+                    except Exception as e:
+                        ret, rec = 'fail', None
+                        print('Except:', p, e, file=sys.stderr)
+                    if cache and rec:
+                        for d in [p] + group[p]:
+                            cache.store(d, rec)
+                    fan_out(p, group[p])
+                    if store:
+                        for d in [p] + group[p]:
+                            store_result(store, d, rec, not args['no_json'])
+                    if ret in ('fail', 'timeout'):
+                        print(ret.capitalize() + ':', p, file=sys.stderr)
+                    status[ret] += 1
+                    status['duplicate'] += len(group[p])
+            # Summary
+            elapsed = time.perf_counter() - start
+            analyzed = status['done'] + status['fail'] + status['timeout']
+            print('Files: {} (done {}, fail {}, timeout {}, ignore {}, '
+                  'resume {}, duplicate {})'.format(
+                      len(path) + len(stored), status['done'],
+                      status['fail'], status['timeout'], status['ignore'],
+                      status['resume'], status['duplicate']))
+            print('Time: {:.1f}s, {:.2f} files/s, {:.2f} analyses/s'.
+                  format(elapsed, (len(path) + len(stored)) / elapsed
+                         if elapsed else 0,
+                         analyzed / elapsed if elapsed else 0))
+        else:
+            for p in group:
+                _, rec = check(p, args, idapro, record.get(p))
+                if cache and rec:
+                    for d in [p] + group[p]:
+                        cache.store(d, rec)
+                fan_out(p, group[p])
+                if store:
+                    for d in [p] + group[p]:
+                        store_result(store, d, rec, not args['no_json'])
+        if cache:
+            cache.close()
+        if store:
+            store.close()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import bisect
+import collections
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import types
+
+import flirt
+
+
+BADADDR = 0xffffffffffffffff
+MS_CLS = 0x600
+FF_CODE = 0x600
+FF_DATA = 0x400
+FF_TAIL = 0x200
+FF_NAME = 0x4000
+FUNC_LIB = 0x4
+dr_O = 1
+fl_CN = 17
+fl_JN = 19
+KIND_FLAGS = {'code': FF_CODE, 'data': FF_DATA}
+PROCNAME = {'arm': 'ARM', 'mc68k': '68K', 'mips': 'mipsb', 'pc': 'metapc',
+            'ppc': 'PPC', 'sh3': 'SH4'}
+FUNCTION_NAME = ('abort', 'atoi', 'calloc', 'close', 'exit', 'fclose',
+                 'fopen', 'fprintf', 'free', 'fwrite', 'malloc', 'memcmp',
+                 'memcpy', 'memmove', 'memset', 'open', 'printf', 'puts',
+                 'read', 'realloc', 'sprintf', 'strchr', 'strcmp', 'strcpy',
+                 'strlen', 'strncmp', 'strncpy', 'write')
+
+Xref = collections.namedtuple('Xref', ('frm', 'to', 'type', 'iscode'))
+
+
+# In-Memory Database of Segments, Items, Names, Functions and Xrefs
+class Database:
+    def __init__(self, procname='metapc', bits=32, start=BADADDR):
+        self.procname = procname
+        self.bits = bits
+        self.start = start
+        self.segment = []
+        self.byte = {}
+        self.head = []
+        self.item = {}
+        self.name = {}
+        self.name_ea = {}
+        self.func = []
+        self.func_end = {}
+        self.func_flags = {}
+        self.xref_to = {}
+        self.xref_from = {}
+        self.type = {}
+        self.sig_dir = None
+        self.signature = []
+        self.idb_path = os.path.abspath('fakeida.idb')
+        self.input_path = ''
+        self.argv = []
+
+    # Build
+    def add_segment(self, start, end, data=None):
+        bisect.insort(self.segment, (start, end))
+        self.byte[start] = bytearray(data or b'').ljust(end - start, b'\0')
+
+    def add_item(self, ea, size, kind='code'):
+        if ea not in self.item:
+            bisect.insort(self.head, ea)
+        self.item[ea] = (size, kind)
+
+    def add_xref(self, frm, to, type):
+        self.xref_from.setdefault(frm, []).append((to, type))
+        self.xref_to.setdefault(to, []).append((frm, type))
+
+    def set_bytes(self, ea, data):
+        seg = self.get_segment(ea)
+        if seg:
+            st = ea - seg[0]
+            self.byte[seg[0]][st:st + len(data)] = data
+
+    # Query
+    def get_segment(self, ea):
+        i = bisect.bisect_right(self.segment, (ea, BADADDR)) - 1
+        if i >= 0 and self.segment[i][0] <= ea < self.segment[i][1]:
+            return self.segment[i]
+        return None
+
+    def get_head(self, ea):
+        if ea in self.item:
+            return ea
+        i = bisect.bisect_right(self.head, ea) - 1
+        if i >= 0 and ea < self.head[i] + self.item[self.head[i]][0]:
+            return self.head[i]
+        return None
+
+    def get_item_end(self, ea):
+        h = self.get_head(ea)
+        return ea + 1 if h is None else h + self.item[h][0]
+
+    def get_func(self, ea):
+        i = bisect.bisect_right(self.func, ea) - 1
+        if i >= 0 and ea < self.func_end[self.func[i]]:
+            return self.func[i]
+        return None
+
+    def add_func(self, start, end=BADADDR):
+        if end == BADADDR:
+            h = self.get_head(start)
+            end = h + self.item[h][0] if h is not None else start + 1
+        if start >= end or self.get_func(start) is not None:
+            return False
+        i = bisect.bisect_right(self.func, start)
+        if i < len(self.func) and self.func[i] < end:
+            return False
+        self.func.insert(i, start)
+        self.func_end[start] = end
+        self.func_flags[start] = 0
+        return True
+
+    def set_name(self, ea, name):
+        if name and self.name_ea.get(name, ea) != ea:
+            return False
+        old = self.name.pop(ea, None)
+        if old is not None:
+            del self.name_ea[old]
+        if name:
+            self.name[ea] = name
+            self.name_ea[name] = ea
+        return True
+
+    # Apply Signature (library functions matched at the function start)
+    def apply_signature(self, name):
+        if not self.sig_dir:
+            return
+        self.signature.append(name)
+        sig = flirt.load(os.path.join(self.sig_dir, name))
+        data = {}
+        for ea in self.func:
+            seg = self.get_segment(ea)
+            if not seg:
+                continue
+            if seg[0] not in data:
+                data[seg[0]] = bytes(self.byte[seg[0]])
+            buf = data[seg[0]]
+            module = flirt.match(sig.root, buf, ea - seg[0], len(buf))
+            if module:
+                self.func_flags[ea] |= FUNC_LIB
+                for offset, n, local in module[0].public:
+                    if offset == 0 and not local:
+                        self.set_name(ea, n)
+                        break
+
+    # Module Objects of idc, idautils and idaapi
+    def get_module(self):
+        idc = types.ModuleType('idc')
+        idautils = types.ModuleType('idautils')
+        idaapi = types.ModuleType('idaapi')
+        db = self
+
+        def get_first_seg():
+            return db.segment[0][0] if db.segment else BADADDR
+
+        def get_next_seg(ea):
+            i = bisect.bisect_right(db.segment, (ea, BADADDR))
+            return db.segment[i][0] if i < len(db.segment) else BADADDR
+
+        def get_segm_start(ea):
+            seg = db.get_segment(ea)
+            return seg[0] if seg else BADADDR
+
+        def get_segm_end(ea):
+            seg = db.get_segment(ea)
+            return seg[1] if seg else BADADDR
+
+        def get_full_flags(ea):
+            h = db.get_head(ea)
+            if h is None:
+                flags = 0
+            elif h != ea:
+                return FF_TAIL
+            else:
+                flags = KIND_FLAGS.get(db.item[h][1], 0)
+            return flags | FF_NAME if ea in db.name else flags
+
+        def get_func_flags(ea):
+            f = db.get_func(ea)
+            return -1 if f is None else db.func_flags[f]
+
+        def set_func_flags(ea, flags):
+            f = db.get_func(ea)
+            if f is None:
+                return False
+            db.func_flags[f] = flags
+            return True
+
+        def get_func_attr(ea, attr):
+            f = db.get_func(ea)
+            if f is None:
+                return BADADDR
+            return f if attr == idc.FUNCATTR_START else db.func_end[f]
+
+        def get_name(ea, gtn_flags=0):
+            return db.name.get(ea, '')
+
+        def get_name_ea_simple(name):
+            return db.name_ea.get(name, BADADDR)
+
+        def set_name(ea, name, flags=0):
+            return db.set_name(ea, name)
+
+        def get_inf_attr(attr):
+            return db.start if attr == idc.INF_START_EA else db.procname
+
+        def get_bytes(ea, size, use_dbg=False):
+            seg = db.get_segment(ea)
+            if not seg:
+                return None
+            return bytes(db.byte[seg[0]][ea - seg[0]:ea - seg[0] + size])
+
+        def parse_decl(decl, flags):
+            return '', decl.encode(), b''
+
+        def apply_type(ea, pt, flags=0):
+            db.type[ea] = pt
+            return True
+
+        def Functions(start=0, end=BADADDR):
+            i = bisect.bisect_left(db.func, start)
+            j = bisect.bisect_left(db.func, end)
+            return iter(db.func[i:j])
+
+        def Names():
+            return iter(sorted(db.name.items()))
+
+        def XrefsTo(ea, flags=0):
+            return (Xref(frm, ea, t, t >= fl_CN)
+                    for frm, t in db.xref_to.get(ea, ()))
+
+        def XrefsFrom(ea, flags=0):
+            return (Xref(ea, to, t, t >= fl_CN)
+                    for to, t in db.xref_from.get(ea, ()))
+
+        class InfStructure:
+            def is_64bit(self):
+                return db.bits == 64
+
+        idc.__dict__.update(
+            BADADDR=BADADDR, FUNC_LIB=FUNC_LIB, GN_VISIBLE=1, PT_SILENT=1,
+            INF_START_EA=0, INF_PROCNAME=1, FUNCATTR_START=0,
+            FUNCATTR_END=4, dr_O=dr_O, fl_CN=fl_CN, fl_JN=fl_JN,
+            ARGV=db.argv,
+            get_first_seg=get_first_seg, get_next_seg=get_next_seg,
+            get_segm_start=get_segm_start, get_segm_end=get_segm_end,
+            get_item_end=db.get_item_end, get_full_flags=get_full_flags,
+            is_code=lambda f: f & MS_CLS == FF_CODE,
+            is_data=lambda f: f & MS_CLS == FF_DATA,
+            is_tail=lambda f: f & MS_CLS == FF_TAIL,
+            hasName=lambda f: bool(f & FF_NAME),
+            get_func_flags=get_func_flags, set_func_flags=set_func_flags,
+            get_func_attr=get_func_attr, add_func=db.add_func,
+            get_name=get_name, get_name_ea_simple=get_name_ea_simple,
+            set_name=set_name, get_inf_attr=get_inf_attr,
+            get_bytes=get_bytes, parse_decl=parse_decl,
+            apply_type=apply_type,
+            get_idb_path=lambda: db.idb_path,
+            get_input_file_path=lambda: db.input_path,
+            plan_to_apply_idasgn=db.apply_signature,
+            auto_wait=lambda: True,
+            add_default_til=lambda name: 1,
+            qexit=sys.exit)
+        idautils.__dict__.update(Functions=Functions, Names=Names,
+                                 XrefsTo=XrefsTo, XrefsFrom=XrefsFrom)
+        idaapi.__dict__.update(
+            BADADDR=BADADDR,
+            get_inf_structure=InfStructure,
+            get_idasgn_qty=lambda: len(db.signature),
+            get_idasgn_desc=lambda i: (db.signature[i], ''),
+            get_kernel_version=lambda: 'fakeida')
+        return idc, idautils, idaapi
+
+
+# Install the Database as idc, idautils and idaapi (context manager)
+# The modules already imported (e.g. prepare) are also switched to it.
+# The previous modules and attributes are restored at the exit.
+@contextlib.contextmanager
+def install(db, *module):
+    idc, idautils, idaapi = db.get_module()
+    new = {'idc': idc, 'idautils': idautils, 'idaapi': idaapi}
+    missing = object()
+    saved = {k: sys.modules.get(k, missing) for k in new}
+    attr = [(m, k, getattr(m, k, missing)) for m in module for k in new]
+    sys.modules.update(new)
+    for m in module:
+        for k, v in new.items():
+            setattr(m, k, v)
+    try:
+        yield idc, idautils, idaapi
+    finally:
+        for m, k, v in attr:
+            if v is not missing:
+                setattr(m, k, v)
+            elif hasattr(m, k):
+                delattr(m, k)
+        for k, v in saved.items():
+            if v is not missing:
+                sys.modules[k] = v
+            else:
+                sys.modules.pop(k, None)
+
+
+# Load Database from JSON
+# {"procname": "metapc", "bits": 32, "start": ea,
+#  "segment": [[start, end, hex bytes]], "item": [[ea, size, kind]],
+#  "function": [[start, end]], "name": [[ea, name]],
+#  "xref": [[from, to, type]]}
+def load_json(file):
+    with open(file) as f:
+        data = json.load(f)
+    db = Database(data.get('procname', 'metapc'), data.get('bits', 32),
+                  data.get('start', BADADDR))
+    for e in data.get('segment', ()):
+        db.add_segment(e[0], e[1], bytes.fromhex(e[2]) if len(e) > 2
+                       else None)
+    for e in data.get('item', ()):
+        db.add_item(*e)
+    for start, end in data.get('function', ()):
+        db.add_func(start, end)
+    for ea, name in data.get('name', ()):
+        db.set_name(ea, name)
+    for frm, to, type in data.get('xref', ()):
+        db.add_xref(frm, to, type)
+    return db
+
+
+# Load Database from Disassembly Listing of "objdump -d"
+def load_listing(file):
+    re_format = re.compile(r'.*file format elf(32|64)-(\S+)')
+    re_section = re.compile(r'Disassembly of section (\S+):')
+    re_symbol = re.compile(r'([\da-f]+) <(.+)>:')
+    re_insn = re.compile(r'\s*([\da-f]+):\t((?:[\da-f]{2,8} ?)+)'
+                         r'\s*(?:\t(.*))?')
+    re_offset = re.compile(r'.*[+-]0x[\da-f]+')
+    re_target = re.compile(r'([\da-f]+) <[^>]*>\s*$')
+    db = Database()
+    symbol = []
+    insn = []
+    section = []
+    with open(file) as f:
+        for s in f:
+            s = s.rstrip('\n')
+            m = re_format.match(s)
+            if m:
+                db.bits = int(m.group(1))
+                arch = m.group(2)
+                cpu = 'arm' if 'arm' in arch or 'aarch' in arch \
+                    else 'mips' if 'mips' in arch \
+                    else 'ppc' if 'powerpc' in arch \
+                    else 'sh3' if arch.startswith('sh') \
+                    else 'mc68k' if 'm68k' in arch else 'pc'
+                db.procname = PROCNAME[cpu]
+                continue
+            if re_section.match(s):
+                section.append([])
+                continue
+            m = re_symbol.fullmatch(s)
+            if m:
+                # Not the label relative to a symbol or a section
+                if not re_offset.fullmatch(m.group(2)) \
+                        and not m.group(2).startswith('.'):
+                    symbol.append((int(m.group(1), 16), m.group(2)))
+                continue
+            m = re_insn.fullmatch(s)
+            if m and section:
+                ea = int(m.group(1), 16)
+                data = bytes.fromhex(m.group(2).replace(' ', ''))
+                if m.group(3) is None and insn \
+                        and insn[-1][0] + len(insn[-1][1]) == ea:
+                    insn[-1][1] += data
+                    continue
+                insn.append([ea, data, m.group(3) or ''])
+                section[-1].append(len(insn) - 1)
+    # Segment and Item
+    for index in section:
+        if not index:
+            continue
+        st = insn[index[0]][0]
+        ed = insn[index[-1]][0] + len(insn[index[-1]][1])
+        db.add_segment(st, ed)
+        for i in index:
+            ea, data, text = insn[i]
+            db.set_bytes(ea, data)
+            db.add_item(ea, len(data), 'code')
+    # Name and Function (up to the next symbol in the segment)
+    symbol.sort()
+    for i, (ea, name) in enumerate(symbol):
+        seg = db.get_segment(ea)
+        if not seg:
+            continue
+        end = seg[1]
+        if i + 1 < len(symbol) and symbol[i + 1][0] < end:
+            end = symbol[i + 1][0]
+        db.set_name(ea, name)
+        db.add_func(ea, end)
+    if symbol:
+        db.start = symbol[0][0]
+        for ea, name in symbol:
+            if name == '_start':
+                db.start = ea
+    # Xref
+    for ea, data, text in insn:
+        m = re_target.search(text)
+        if m:
+            mnem = text.split()[0] if text.split() else ''
+            type = fl_CN if mnem.startswith(('call', 'bl', 'jal', 'bsr')) \
+                else fl_JN if mnem.startswith(('j', 'b')) else dr_O
+            db.add_xref(ea, int(m.group(1), 16), type)
+    return db
+
+
+# Generate Database of the Items
+# Most code belongs to functions named after library functions, optionally
+# with "_<hex>" suffix; the entry refers to an unnamed function as main.
+def generate(n, seed=0, name=FUNCTION_NAME, bits=32):
+    rnd = random.Random(seed)
+    db = Database(bits=bits)
+    ea = 0x10000
+    n_seg = max(1, n // 100000)
+    code = []
+    for s in range(n_seg):
+        st = ea
+        count = n // n_seg
+        data = bytearray()
+        for i in range(count):
+            size = rnd.choice((1, 2, 3, 4, 4, 5, 6))
+            kind = 'code' if rnd.random() < 0.9 else 'data'
+            db.head.append(ea)
+            db.item[ea] = (size, kind)
+            data.extend(rnd.getrandbits(8 * size).to_bytes(size, 'little'))
+            if kind == 'code':
+                code.append(ea)
+            ea += size
+        db.add_segment(st, ea, data)
+        ea += 0x1000
+    # Function
+    i = 0
+    func = []
+    while i < len(code):
+        length = rnd.randint(4, 64)
+        st = code[i]
+        i += length
+        if rnd.random() < 0.95:
+            end = code[i] if i < len(code) else db.get_item_end(code[-1])
+            if db.get_segment(st) == db.get_segment(end - 1):
+                db.func.append(st)
+                db.func_end[st] = end
+                db.func_flags[st] = 0
+                func.append(st)
+    # Name
+    for f in func:
+        r = rnd.random()
+        if r < 0.3:
+            db.set_name(f, rnd.choice(name))
+        elif r < 0.6:
+            db.set_name(f, '{}_{:X}'.format(rnd.choice(name), f))
+    # Xref
+    for _ in range(len(code) // 4):
+        db.add_xref(rnd.choice(code), rnd.choice(code), fl_JN)
+    for _ in range(len(func)):
+        db.add_xref(rnd.choice(code), rnd.choice(func), fl_CN)
+    # Entry Referring to main
+    unnamed = [f for f in func if f not in db.name]
+    if func and unnamed:
+        db.start = func[0]
+        db.set_name(db.start, '')
+        db.add_xref(db.start, rnd.choice(unnamed), dr_O)
+    return db
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake IDA Database.')
+    parser.add_argument('path', help='JSON or disassembly listing')
+    args = vars(parser.parse_args())
+    if args['path'].endswith('.json'):
+        db = load_json(args['path'])
+    else:
+        db = load_listing(args['path'])
+    print('Processor:', db.procname, db.bits)
+    print('Segment:', len(db.segment))
+    print('Item:', len(db.item))
+    print('Function:', len(db.func))
+    print('Name:', len(db.name))
+    print('Xref:', sum(map(len, db.xref_from.values())))
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import glob
+import heapq
+import importlib
+import os
+import struct
+import sys
+import zlib
+try:
+    importlib.reload(prepare)
+except NameError:
+    import prepare
+
+
+FEATURE_COMPRESSED = 0x10
+PARSE_MORE_PUBLIC_NAMES = 0x01
+PARSE_READ_TAIL_BYTES = 0x02
+PARSE_READ_REFERENCED_FUNCTIONS = 0x04
+PARSE_MORE_MODULES_WITH_SAME_CRC = 0x08
+PARSE_MORE_MODULES = 0x10
+FUNCTION_LOCAL = 0x02
+FUNCTION_UNRESOLVED_COLLISION = 0x08
+PATTERN_SIZE = 32
+HEADER_SIZE = 300
+
+# Instruction Alignment of Function Candidates
+ALIGNMENT = {'arm': 4, 'mc68k': 2, 'mips': 4, 'pc': 1, 'ppc': 4, 'sh3': 2}
+
+# CRC16 (Polynomial 0x8408)
+CRC16_TABLE = []
+for i in range(256):
+    c = i
+    for _ in range(8):
+        c = (c >> 1) ^ 0x8408 if c & 1 else c >> 1
+    CRC16_TABLE.append(c)
+
+
+def crc16(data):
+    if not data:
+        return 0
+    crc = 0xFFFF
+    for b in data:
+        crc = (crc >> 8) ^ CRC16_TABLE[(crc ^ b) & 0xFF]
+    crc = ~crc & 0xFFFF
+    return ((crc << 8) | (crc >> 8)) & 0xFFFF
+
+
+class Module:
+    __slots__ = ('crc_length', 'crc16', 'length', 'public', 'tail', 'ref',
+                 'sig')
+
+    def __init__(self, crc_length, crc, length):
+        self.crc_length = crc_length
+        self.crc16 = crc
+        self.length = length
+        self.public = []    # (offset, name, local)
+        self.tail = []      # (offset, value)
+        self.ref = []       # (offset, name)
+        self.sig = None     # source signature of the merged tree
+
+
+class Node:
+    __slots__ = ('length', 'mask', 'value', 'children', 'modules', 'index')
+
+    def __init__(self, length=0, mask=0, value=0):
+        self.length = length
+        self.mask = mask
+        self.value = value
+        self.children = []
+        self.modules = []
+        self.index = None
+
+
+class Signature:
+    def __init__(self, name, version, n_functions, root):
+        self.name = name
+        self.version = version
+        self.n_functions = n_functions
+        self.root = root
+
+
+class SignatureError(Exception):
+    pass
+
+
+class Reader:
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def byte(self):
+        try:
+            b = self.buf[self.pos]
+        except IndexError:
+            raise SignatureError('unexpected end of signature')
+        self.pos += 1
+        return b
+
+    def bytes(self, n):
+        b = self.buf[self.pos:self.pos + n]
+        if len(b) != n:
+            raise SignatureError('unexpected end of signature')
+        self.pos += n
+        return b
+
+    def short(self):
+        return (self.byte() << 8) + self.byte()
+
+    def word(self):
+        return (self.short() << 16) + self.short()
+
+    def max_2_bytes(self):
+        b = self.byte()
+        return ((b & 0x7F) << 8) + self.byte() if b & 0x80 else b
+
+    def multiple_bytes(self):
+        b = self.byte()
+        if b & 0x80 != 0x80:
+            return b
+        if b & 0xC0 != 0xC0:
+            return ((b & 0x7F) << 8) + self.byte()
+        if b & 0xE0 != 0xE0:
+            return ((b & 0x3F) << 24) + (self.byte() << 16) + self.short()
+        return self.word()
+
+
+# Parse Signature Header
+# (version, features, number of functions, name, end of header)
+def read_header(buf):
+    if buf[:6] != b'IDASGN':
+        raise SignatureError('not a signature')
+    version, = struct.unpack_from('<B', buf, 6)
+    if not 5 <= version <= 10:
+        raise SignatureError('unsupported version: ' + str(version))
+    features, = struct.unpack_from('<H', buf, 16)
+    n_functions = 0
+    name_len = buf[34]
+    pos = 37
+    if version >= 6:
+        n_functions, = struct.unpack_from('<I', buf, pos)
+        pos += 4
+    if version >= 8:
+        pos += 2
+    if version >= 10:
+        pos += 2
+    name = buf[pos:pos + name_len].decode(errors='replace')
+    return version, features, n_functions, name, pos + name_len
+
+
+# Read Only the Header of Signature File
+def load_header(file):
+    with open(file, 'rb') as f:
+        buf = f.read(HEADER_SIZE)
+    try:
+        version, _, n_functions, name, _ = read_header(buf)
+    except (SignatureError, struct.error, IndexError) as e:
+        raise SignatureError(str(e) + ': ' + file)
+    return Signature(name, version, n_functions, None)
+
+
+# Parse Signature File
+def load(file):
+    with open(file, 'rb') as f:
+        buf = f.read()
+    try:
+        version, features, n_functions, name, pos = read_header(buf)
+    except SignatureError as e:
+        raise SignatureError(str(e) + ': ' + file)
+    buf = buf[pos:]
+    if features & FEATURE_COMPRESSED:
+        try:
+            buf = zlib.decompress(buf, -15 if version < 7 else 15)
+        except zlib.error as e:
+            raise SignatureError(str(e))
+    reader = Reader(buf)
+    root = Node()
+    parse_tree(reader, version, root)
+    return Signature(name, version, n_functions, root)
+
+
+def parse_tree(reader, version, node):
+    count = reader.multiple_bytes()
+    if count == 0:
+        parse_leaf(reader, version, node)
+        return
+    for _ in range(count):
+        length = reader.byte()
+        if length < 0x10:
+            variant = reader.max_2_bytes()
+        elif length <= 0x20:
+            variant = reader.multiple_bytes()
+        elif length <= 0x40:
+            variant = (reader.multiple_bytes() << 32) \
+                + reader.multiple_bytes()
+        else:
+            raise SignatureError('invalid pattern length')
+        mask = value = 0
+        for i in range(length):
+            mask <<= 8
+            value <<= 8
+            if not variant >> (length - 1 - i) & 1:
+                mask |= 0xFF
+                value |= reader.byte()
+        child = Node(length, mask, value)
+        parse_tree(reader, version, child)
+        node.children.append(child)
+
+
+def parse_leaf(reader, version, node):
+    offset_reader = reader.multiple_bytes if version >= 9 \
+        else reader.max_2_bytes
+    flags = PARSE_MORE_MODULES
+    while flags & PARSE_MORE_MODULES:
+        crc_length = reader.byte()
+        crc = reader.short()
+        flags = PARSE_MORE_MODULES_WITH_SAME_CRC
+        while flags & PARSE_MORE_MODULES_WITH_SAME_CRC:
+            module = Module(crc_length, crc, offset_reader())
+            # Public Function
+            offset = 0
+            flags = PARSE_MORE_PUBLIC_NAMES
+            while flags & PARSE_MORE_PUBLIC_NAMES:
+                offset += offset_reader()
+                b = reader.byte()
+                local = False
+                if b < 0x20:
+                    local = bool(b & FUNCTION_LOCAL)
+                    b = reader.byte()
+                name = bytearray()
+                while b >= 0x20:
+                    name.append(b)
+                    b = reader.byte()
+                flags = b
+                module.public.append((offset, name.decode(errors='replace'),
+                                      local))
+            # Tail Byte
+            if flags & PARSE_READ_TAIL_BYTES:
+                for _ in range(reader.byte() if version >= 8 else 1):
+                    module.tail.append((offset_reader(), reader.byte()))
+            # Referenced Function
+            if flags & PARSE_READ_REFERENCED_FUNCTIONS:
+                for _ in range(reader.byte() if version >= 8 else 1):
+                    offset = offset_reader()
+                    n = reader.byte()
+                    if n == 0:
+                        n = reader.multiple_bytes()
+                    name = reader.bytes(n).rstrip(b'\0')
+                    module.ref.append((offset, name.decode(errors='replace')))
+            node.modules.append(module)
+
+
+# Index Children by Leading Byte
+def get_index(node):
+    if node.index is None:
+        index = {}
+        variant = []
+        for child in node.children:
+            shift = (child.length - 1) * 8
+            if child.mask >> shift & 0xFF:
+                index.setdefault(child.value >> shift & 0xFF, []). \
+                    append(child)
+            else:
+                variant.append(child)
+        node.index = ({k: v + variant for k, v in index.items()}, variant)
+    return node.index
+
+
+# Match Modules at the Position
+def match(node, buf, pos, end, depth=0):
+    ret = []
+    if node.modules:
+        base = pos - depth
+        for module in node.modules:
+            st = base + PATTERN_SIZE
+            if base + module.length > end \
+                    or st + module.crc_length > end \
+                    or (module.crc_length
+                        and crc16(buf[st:st + module.crc_length])
+                        != module.crc16):
+                continue
+            st += module.crc_length
+            for offset, value in module.tail:
+                if st + offset >= end or buf[st + offset] != value:
+                    break
+            else:
+                ret.append(module)
+    if node.children and pos < end:
+        index, variant = get_index(node)
+        for child in index.get(buf[pos], variant):
+            ed = pos + child.length
+            b = buf[pos:ed]
+            if len(b) < child.length:
+                b = b.ljust(child.length, b'\0')
+            if int.from_bytes(b, 'big') & child.mask == child.value:
+                ret.extend(match(child, buf, ed, end, depth + child.length))
+    return ret
+
+
+# Find Function Candidates from Direct Calls and Address Constants
+def get_candidate(buf, cpu, endian, bits, entry, area):
+    align = ALIGNMENT[cpu]
+
+    def to_offset(addr):
+        for st, ed, va in area:
+            if va <= addr < va + ed - st:
+                return st + addr - va
+        return None
+
+    target = {entry}
+    target.update(va for _, _, va in area)
+    # Address Constant
+    size = bits // 8
+    fmt = endian + ('I' if size == 4 else 'Q')
+    lo = min(va for _, _, va in area)
+    hi = max(va + ed - st for st, ed, va in area)
+    for (v,) in struct.iter_unpack(fmt, buf[:len(buf) - len(buf) % size]):
+        if lo <= v < hi and not v % align:
+            target.add(v)
+    # Direct Call
+    for st, ed, va in area:
+        if cpu == 'pc':
+            pos = buf.find(b'\xE8', st, ed - 4)
+            while pos >= 0:
+                rel, = struct.unpack_from('<i', buf, pos + 1)
+                target.add(va + pos - st + 5 + rel)
+                pos = buf.find(b'\xE8', pos + 1, ed - 4)
+        elif cpu in ('arm', 'mips', 'ppc'):
+            for i in range(st + -st % 4, ed - 3, 4):
+                w, = struct.unpack_from(endian + 'I', buf, i)
+                pc = va + i - st
+                if cpu == 'arm' and w & 0x0F000000 == 0x0B000000:
+                    target.add(pc + 8 + ((w & 0xFFFFFF ^ 0x800000)
+                                         - 0x800000) * 4)
+                elif cpu == 'mips' and w >> 26 == 3:
+                    target.add((pc + 4) & 0xF0000000 | (w & 0x3FFFFFF) << 2)
+                elif cpu == 'ppc' and w & 0xFC000003 == 0x48000001:
+                    target.add(pc + ((w & 0x3FFFFFC ^ 0x2000000)
+                                     - 0x2000000))
+        elif cpu == 'sh3':
+            for i in range(st + -st % 2, ed - 1, 2):
+                w, = struct.unpack_from(endian + 'H', buf, i)
+                if w & 0xF000 == 0xB000:
+                    target.add(va + i - st + 4
+                               + ((w & 0xFFF ^ 0x800) - 0x800) * 2)
+        elif cpu == 'mc68k':
+            pos = buf.find(b'\x61', st, ed - 5)
+            while pos >= 0:
+                if not (pos - st) % 2:
+                    d = buf[pos + 1]
+                    if d == 0:
+                        d, = struct.unpack_from('>h', buf, pos + 2)
+                    elif d == 0xFF:
+                        d, = struct.unpack_from('>i', buf, pos + 2)
+                    else:
+                        d = (d ^ 0x80) - 0x80
+                    target.add(va + pos - st + 2 + d)
+                pos = buf.find(b'\x61', pos + 1, ed - 5)
+    ret = set()
+    for addr in target:
+        if not addr % align:
+            pos = to_offset(addr)
+            if pos is not None:
+                ret.add(pos)
+    return sorted(ret)
+
+
+# Merge Signatures into a Single Tree
+def merge(signature):
+    root = Node()
+    for key in sorted(signature):
+        merge_node(root, signature[key].root, key, {})
+    return root
+
+
+def merge_node(dst, src, key, child):
+    for module in src.modules:
+        module.sig = key
+        dst.modules.append(module)
+    if src.children and not child:
+        child.update(((c.length, c.mask, c.value), (c, {}))
+                     for c in dst.children)
+    for c in src.children:
+        k = (c.length, c.mask, c.value)
+        if k not in child:
+            node = Node(c.length, c.mask, c.value)
+            dst.children.append(node)
+            child[k] = (node, {})
+        node, grandchild = child[k]
+        merge_node(node, c, key, grandchild)
+    dst.index = None
+
+
+# Count Functions whose Start Matches Each Signature of the Merged Tree
+# segment: [(bytes of the segment, [offsets of the function starts])]
+# A function is counted once for each signature which has a module matching
+# at its start, as IDA Pro marks it as a library function.
+def count_function(root, segment):
+    ret = {}
+    for buf, candidate in segment:
+        for pos in candidate:
+            for k in {m.sig for m in match(root, buf, pos, len(buf))}:
+                ret[k] = ret.get(k, 0) + 1
+    return ret
+
+
+# Upper Bounds of the Estimates of the Signatures
+# segment: [(bytes of the segment, [offsets of the function starts])]
+# IDA Pro marks a function as a library function only if a module of the
+# signature matches at its start, so the estimate does not exceed the number
+# of such functions as long as applying the signature creates no function.
+def get_bound(signature, segment):
+    ret = dict.fromkeys(signature, 0)
+    ret.update(count_function(merge(signature), segment))
+    return ret
+
+
+# Count Functions Matched at the Candidates for Each Signature
+def count(root, buf, area, candidate, align=1):
+    addr = {}
+    bound = {}
+    queue = [(pos, '') for pos in candidate]
+    heapq.heapify(queue)
+    while queue:
+        pos, key = heapq.heappop(queue)
+        if key and bound.get(key, 0) > pos:
+            continue
+        for st, ed, _ in area:
+            if st <= pos < ed:
+                break
+        else:
+            continue
+        matched = {}
+        for m in match(root, buf, pos, ed):
+            if bound.get(m.sig, 0) <= pos and key in ('', m.sig):
+                matched.setdefault(m.sig, []).append(m)
+        for k, module in matched.items():
+            for m in module:
+                addr.setdefault(k, set()). \
+                    update(pos + offset for offset, _, _ in m.public)
+            bound[k] = pos + max(max(m.length for m in module), 1)
+            # Contiguous Module of the Static Library
+            p = bound[k] + -bound[k] % align
+            while p < ed and not buf[p:p + align].strip(b'\0'):
+                p += align
+            heapq.heappush(queue, (p, k))
+    return {k: len(v) for k, v in addr.items()}
+
+
+# Estimate Signatures without IDA Pro
+# signame: names of the signatures to estimate (default: all)
+def estimate(file, sig_dir, signame=None):
+    ret = {}
+    info = prepare.get_elf_section(file)
+    if info and info[4]:
+        cpu, endian, bits, entry, area = info
+        signature = {}
+        for path in sorted(glob.glob(os.path.join(sig_dir, cpu, '_*_*.sig'))):
+            if signame is not None and os.path.basename(path) not in signame:
+                continue
+            try:
+                signature[os.path.basename(path)] = load(path)
+            except SignatureError as e:
+                print(path, e, file=sys.stderr)
+        with open(file, 'rb') as f:
+            buf = f.read()
+        candidate = get_candidate(buf, cpu, endian, bits, entry, area)
+        ret = dict.fromkeys(signature, 0)
+        ret.update(count(merge(signature), buf, area, candidate,
+                         ALIGNMENT[cpu]))
+    return ret
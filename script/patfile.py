@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import hashlib
+import os
+
+
+# First Character of the Leading Byte -> "0" if Wildcard, "1" if Fixed
+MASK_TABLE = str.maketrans('.0123456789ABCDEFabcdef',
+                           '01111111111111111111111')
+
+
+# Module Line of Pattern File
+# The fields are parsed from the line when they are accessed at first.
+# lead: leading bytes (wildcard is 0), mask: bit of the fixed leading byte
+# (the first byte is the most significant bit), public: (offset, name, local),
+# ref: (offset, name), tail: hexadecimal tail bytes
+class Module:
+    __slots__ = ('line', '_field')
+
+    def __init__(self, line):
+        self.line = line
+        self._field = None
+
+    # (head, CRC length, CRC, size, public, ref, tail)
+    def get_field(self):
+        if self._field is None:
+            element = self.line.decode(errors='surrogateescape').split()
+            n = len(element)
+            if n < 4:
+                element += ['', '0', '0', '0'][n:]
+            public = []
+            ref = []
+            i = 4
+            while n - i >= 2:
+                e = element[i]
+                i += 1
+                kind = e[:1]
+                if kind == ':' or kind == '^':
+                    try:
+                        offset = int(e.lstrip(kind).rstrip('@'), 16)
+                    except ValueError:
+                        continue
+                    name = element[i]
+                    i += 1
+                    if kind == ':':
+                        public.append((offset, name, e.endswith('@')))
+                    else:
+                        ref.append((offset, name))
+            self._field = (element[0], int(element[1], 16),
+                           int(element[2], 16), int(element[3], 16),
+                           tuple(public), tuple(ref),
+                           element[i] if 4 <= i < n else '')
+        return self._field
+
+    @property
+    def lead(self):
+        return bytes.fromhex(self.get_field()[0].replace('..', '00'))
+
+    @property
+    def mask(self):
+        return int(self.get_field()[0][::2].translate(MASK_TABLE) or '0', 2)
+
+    @property
+    def crc_length(self):
+        return self.get_field()[1]
+
+    @property
+    def crc16(self):
+        return self.get_field()[2]
+
+    @property
+    def length(self):
+        return self.get_field()[3]
+
+    @property
+    def public(self):
+        return self.get_field()[4]
+
+    @property
+    def ref(self):
+        return self.get_field()[5]
+
+    @property
+    def tail(self):
+        return self.get_field()[6]
+
+
+# Streaming Reader of Pattern File
+# The module lines are yielded until "---", and terminated is set by it.
+class PatternReader:
+    def __init__(self, file):
+        self.file = file
+        self.terminated = False
+
+    def __iter__(self):
+        with open(self.file, 'rb') as f:
+            for s in f:
+                s = s.rstrip(b'\r\n')
+                if s.strip() == b'---':
+                    self.terminated = True
+                    break
+                if s.strip():
+                    yield Module(s)
+
+
+# Read Pattern File once and Feed the Modules to Each Consumer
+# The consumer has module(m) and finish(terminated), and the list of the
+# return values of finish() is returned.
+def scan(file, *consumer):
+    reader = PatternReader(file)
+    for m in reader:
+        for c in consumer:
+            c.module(m)
+    return [c.finish(reader.terminated) for c in consumer]
+
+
+# SHA-256 of the Modules in Any Order
+class FunctionHash:
+    def __init__(self):
+        self.line = []
+
+    def module(self, m):
+        self.line.append(m.line)
+
+    def finish(self, terminated):
+        if terminated:
+            self.line.append(b'---')
+        self.line.sort()
+        h = hashlib.sha256()
+        for s in self.line:
+            h.update(s + b'\n')
+        return h.hexdigest()
+
+
+# Module Lines in the Order of the File
+class ModuleLine:
+    def __init__(self):
+        self.line = []
+
+    def module(self, m):
+        self.line.append(m.line)
+
+    def finish(self, terminated):
+        return self.line
+
+
+# Number of the Modules and the Public Names
+class Statistics:
+    def __init__(self):
+        self.stat = {'module': 0, 'public': 0, 'local': 0, 'ref': 0}
+
+    def module(self, m):
+        self.stat['module'] += 1
+        for _, _, local in m.public:
+            self.stat['local' if local else 'public'] += 1
+        self.stat['ref'] += len(m.ref)
+
+    def finish(self, terminated):
+        self.stat['terminated'] = terminated
+        return self.stat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pattern File.')
+    parser.add_argument('path', nargs='+', help='pattern file')
+    args = vars(parser.parse_args())
+    for pat in sorted({p for arg in args['path'] for p in glob.glob(arg)
+                       if os.path.isfile(p)}):
+        stat, = scan(pat, Statistics())
+        print(pat, stat['module'], stat['public'], stat['local'],
+              stat['ref'], '' if stat['terminated'] else 'unterminated')
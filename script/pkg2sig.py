@@ -6,19 +6,384 @@
 # Copyright (c) 2022 SecureBrain
 
 
+import argparse
+import concurrent.futures
 import glob
 import hashlib
+import json
 import os
+import pathlib
 import platform
-import re
+import posixpath
 import shutil
 import subprocess
 import sys
+import tarfile
+import tempfile
+import time
+import urllib.error
 import urllib.parse
+import urllib.request
 
+import alias
+import catalog
+import patfile
 
-if __name__ == '__main__':
-    # Package Definition
+
+CHUNK_SIZE = 1 << 20
+DOWNLOAD_RETRY = 3
+DOWNLOAD_TIMEOUT = 60
+
+
+# SHA-256 of File
+def hash_file(file):
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for buf in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(buf)
+    return h.hexdigest()
+
+
+# Checksum Manifest (sha256sum format)
+def read_manifest(file):
+    manifest = {}
+    if os.path.exists(file):
+        with open(file) as f:
+            for s in f:
+                e = s.rstrip('\n').split('  ', 1)
+                if len(e) == 2:
+                    manifest[e[1]] = e[0]
+    return manifest
+
+
+def write_manifest(file, manifest):
+    with open(file + '.part', 'w', newline='\n') as f:
+        for k in sorted(manifest):
+            f.write(manifest[k] + '  ' + k + '\n')
+    os.replace(file + '.part', file)
+
+
+# URL of the File in the Mirror (local directory, file:// or http(s)://)
+def get_mirror_url(mirror, path):
+    if not urllib.parse.urlparse(mirror).scheme \
+            or os.path.isdir(mirror):
+        mirror = pathlib.Path(os.path.abspath(mirror)).as_uri()
+    return mirror.rstrip('/') + '/' + urllib.parse.quote(path)
+
+
+# Download File with Range Resume and Atomic Rename
+def download(url, file, sha256=None):
+    part = file + '.part'
+    for i in range(DOWNLOAD_RETRY):
+        try:
+            size = os.path.getsize(part) if os.path.exists(part) else 0
+            header = {'Range': 'bytes={}-'.format(size)} if size else {}
+            req = urllib.request.Request(url, headers=header)
+            with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) \
+                    as res:
+                resume = size and getattr(res, 'status', None) == 206
+                with open(part, 'ab' if resume else 'wb') as f:
+                    shutil.copyfileobj(res, f, CHUNK_SIZE)
+            h = hash_file(part)
+            if sha256 and h != sha256:
+                os.remove(part)
+                raise ValueError('checksum mismatch: ' + url)
+            os.replace(part, file)
+            return h
+        except (OSError, ValueError) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code == 416:
+                os.remove(part)
+            err = e
+            if i + 1 < DOWNLOAD_RETRY:
+                time.sleep(2 ** i)
+    raise err
+
+
+# Verify or Download File
+def fetch(url, file, sha256=None, verify=False):
+    if os.path.exists(file):
+        if sha256 and not verify:
+            return sha256
+        h = hash_file(file)
+        if not sha256 or h == sha256:
+            return h
+        print('Checksum:', file, file=sys.stderr)
+        os.remove(file)
+    return download(url, file, sha256)
+
+
+# Extract Libraries in a Single Pass of the Archive
+def extract_library(file, name, dst, libfile, table):
+    path = {lf: {} for lf in libfile}
+    try:
+        with tarfile.open(file, 'r|*') as tar:
+            for member in tar:
+                lf = posixpath.basename(member.name)
+                if lf not in libfile:
+                    continue
+                if member.isfile():
+                    src = tar.extractfile(member)
+                elif member.islnk():
+                    link = path.get(posixpath.basename(member.linkname),
+                                    {}).get(member.linkname)
+                    if not link:
+                        continue
+                    src = open(link, 'rb')
+                else:
+                    continue
+                fd, tmp = tempfile.mkstemp(prefix='.' + name + '_',
+                                           suffix='.part', dir=dst)
+                with src, os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(src, f, CHUNK_SIZE)
+                if member.name in path[lf]:
+                    os.remove(path[lf][member.name])
+                path[lf][member.name] = tmp
+        # Rename
+        output = []
+        for lf in libfile:
+            count = {}
+            for p in path[lf]:
+                for i, e in enumerate(p.split('/')):
+                    if i not in count:
+                        count[i] = set()
+                    count[i].add(e)
+            for i in count:
+                count[i] = len(count[i])
+            for p, tmp in path[lf].items():
+                element = [name]
+                for i, e in enumerate(p.split('/')[:-1]):
+                    if count[i] > 1:
+                        element.append(e)
+                lib = os.path.join(dst, '_' + libfile[lf] + '_'
+                                   + '-'.join(element).translate(table)) \
+                    + '.a'
+                os.replace(tmp, lib)
+                output.append(lib)
+    finally:
+        for lf in path:
+            for tmp in path[lf].values():
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    return output
+
+
+# Build Manifest (inputs, tool and options of each artifact)
+class BuildManifest:
+    def __init__(self, file):
+        self.file = file
+        self.base = os.path.dirname(os.path.abspath(file))
+        self.data = {'file': {}, 'function': {}, 'artifact': {}}
+        if os.path.exists(file):
+            with open(file) as f:
+                self.data.update(json.load(f))
+
+    def save(self):
+        with open(self.file + '.part', 'w', newline='\n') as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(self.file + '.part', self.file)
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.base).replace(os.sep, '/')
+
+    # SHA-256 of File Cached by Size and Modification Time
+    # function: SHA-256 of the modules of the pattern file in any order
+    def digest(self, path, function=False):
+        if not path or not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        key = self.relpath(path)
+        data = self.data['function' if function else 'file']
+        cache = data.get(key)
+        if cache and cache[:2] == [st.st_size, st.st_mtime_ns]:
+            return cache[2]
+        h = hash_pattern(path, function)
+        data[key] = [st.st_size, st.st_mtime_ns, h]
+        return h
+
+    def key(self, input, tool=None, option=()):
+        return {'input': {self.relpath(p): d for p, d in input.items()},
+                'tool': tool,
+                'option': list(option)}
+
+    def get(self, artifact):
+        return self.data['artifact'].get(self.relpath(artifact))
+
+    def is_fresh(self, artifact, key, output=None):
+        record = self.get(artifact)
+        if not record or {k: record.get(k) for k in key} != key:
+            return False
+        if output is None:
+            return os.path.exists(artifact)
+        return all(os.path.exists(os.path.join(self.base, p))
+                   for p in record.get('output', ()))
+
+    def update(self, artifact, key, output=None):
+        record = dict(key)
+        if output is not None:
+            record['output'] = sorted(self.relpath(p) for p in output)
+        self.data['artifact'][self.relpath(artifact)] = record
+
+    # Remove the Record, the Artifact and its Outputs
+    def remove(self, artifact):
+        record = self.data['artifact'].pop(self.relpath(artifact), None)
+        for p in (record or {}).get('output', ()):
+            p = os.path.join(self.base, p)
+            if os.path.exists(p):
+                os.remove(p)
+        if os.path.isfile(artifact):
+            os.remove(artifact)
+
+
+# Path of Tool Executable
+def get_tool(tool):
+    return tool if os.path.isfile(tool) else shutil.which(tool)
+
+
+# Run Tool
+def run_tool(cmd):
+    ret = subprocess.run(cmd, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    return ret.returncode, ret.stdout.decode(errors='replace')
+
+
+# Pattern File Terminated by "---"
+def is_pattern(file):
+    with open(file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 64, 0))
+        s = f.read().splitlines()
+    return len(s) > 0 and s[-1].strip() == b'---'
+
+
+# SHA-256 of Pattern File (function: ignoring the order of the modules)
+def hash_pattern(file, function=False):
+    if not function:
+        return hash_file(file)
+    h, = patfile.scan(file, patfile.FunctionHash())
+    return h
+
+
+# Remove Duplicate Patterns by Size and Hash Bucket
+# build: BuildManifest whose digests are cached by size and modification time
+def dedup_pattern(path, build=None, function=False):
+    bucket = {}
+    for pat in sorted(set(path)):
+        if os.path.exists(pat) and is_pattern(pat):
+            bucket.setdefault(os.path.getsize(pat), []).append(pat)
+    pattern = []
+    for size in sorted(bucket):
+        if len(bucket[size]) == 1:
+            pattern.extend(bucket[size])
+            continue
+        content = {}
+        for pat in bucket[size]:
+            digest = build.digest(pat, function) if build \
+                else hash_pattern(pat, function)
+            if digest in content:
+                root, _ = os.path.splitext(content[digest])
+                with open(pat, 'w') as f:
+                    f.write(os.path.basename(root) + '\n')
+            else:
+                content[digest] = pat
+                pattern.append(pat)
+    pattern.sort()
+    return pattern
+
+
+# Family Pattern of the Modules Shared by All the Member Patterns
+def write_family(file, member):
+    module = []
+    common = None
+    for pat in member:
+        line, = patfile.scan(pat, patfile.ModuleLine())
+        if common is None:
+            module = line
+            common = set(line)
+        else:
+            common &= set(line)
+    module = [s for s in module if s in common]
+    if module:
+        with open(file + '.part', 'wb') as f:
+            for s in module:
+                f.write(s + b'\n')
+            f.write(b'---\n')
+        os.replace(file + '.part', file)
+    elif os.path.exists(file):
+        os.remove(file)
+    return len(module)
+
+
+# Hierarchy without the Families which have no Signature
+def prune_family(family, exist):
+    ret = {}
+    for name, child in family.items():
+        if name not in exist:
+            continue
+        ret[name] = []
+        stack = list(reversed(child))
+        while stack:
+            n = stack.pop()
+            if n in family and n not in exist:
+                stack.extend(reversed(family[n]))
+            else:
+                ret[name].append(n)
+    return ret
+
+
+# Name Files of the Pattern Files
+# The digest of each pattern is recorded as the input of the name file.
+# The previous name file is extended by the added patterns, and it is
+# created from all the patterns if a pattern is changed or removed.
+def write_name_file(build, pattern, dir):
+    digest = {pat: build.digest(pat) for pat in pattern}
+    graph = alias.AliasGraph()
+
+    def parse(pattern):
+        for pat in pattern:
+            if pat not in graph.source:
+                graph.add(pat, alias.read_pattern(pat))
+        return pattern
+
+    def get_added(file, key):
+        record = build.get(file)
+        if not record or not os.path.exists(file) \
+                or record.get('tool') != key['tool'] \
+                or record.get('option') != key['option'] \
+                or any(key['input'].get(rel) != d
+                       for rel, d in record.get('input', {}).items()):
+            return None
+        return [pat for pat in pattern
+                if build.relpath(pat) not in record['input']]
+
+    file = os.path.join(dir, 'name_alternate.csv')
+    key = build.key(digest)
+    if not build.is_fresh(file, key):
+        added = get_added(file, key)
+        if added is None:
+            parse(pattern)
+        else:
+            graph.add(file, alias.read_alternate(file))
+            parse(added)
+        alias.write_alternate(file, graph.group())
+        build.update(file, key)
+
+    pattern = [pat for pat in pattern
+               if os.path.basename(pat).startswith('_libgcc_')]
+    file = os.path.join(dir, 'name_ignore.txt')
+    key = build.key({pat: digest[pat] for pat in pattern})
+    if not build.is_fresh(file, key):
+        added = get_added(file, key)
+        if added is None:
+            name = graph.name(parse(pattern))
+        else:
+            name = alias.read_ignore(file) | graph.name(parse(added))
+        alias.write_ignore(file, name)
+        build.update(file, key)
+
+
+# Package Definition
+# {name: {'cpu': cpu, 'pkg': subdirectory, 'url': url}}
+def get_archive():
     architecture = [('arm',   'armv4l'),
                     ('arm',   'armv5l'),
                     ('mc68k', 'm68k'),
@@ -72,6 +437,11 @@ if __name__ == '__main__':
         archive[name]['url'] \
             = 'https://landley.net/aboriginal/downloads/old/binaries/' \
             + version + '/cross-compiler-' + label + '.tar.' + ext
+    return archive
+
+
+if __name__ == '__main__':
+    archive = get_archive()
 
     # CPU
     cpu_opt = (('arm',   ('-r104:0:0',)),
@@ -81,8 +451,26 @@ if __name__ == '__main__':
                ('ppc',   ('-r67:0:0', '-r87:0:0')),
                ('sh3',   ('-r2:0:0',  '-r147:0:0')))
     # Execution Environmant
-    cur_dir = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 \
-        else os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Package to Signature.')
+    parser.add_argument('dir', nargs='?',
+                        default=os.path.dirname(os.path.abspath(__file__)),
+                        help='working directory')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of parallel extractions and tools')
+    parser.add_argument('--download-jobs', type=int, default=4,
+                        help='number of parallel downloads')
+    parser.add_argument('--pelf', help='pelf executable')
+    parser.add_argument('--sigmake', help='sigmake executable')
+    parser.add_argument('--dedup', choices=('file', 'function'),
+                        default='file',
+                        help='remove duplicate pattern files or ones '
+                        'having same modules')
+    parser.add_argument('--mirror',
+                        help='local directory or base URL of package mirror')
+    parser.add_argument('--verify', action='store_true',
+                        help='verify checksum of downloaded packages')
+    args = vars(parser.parse_args())
+    cur_dir = os.path.abspath(args['dir'])
     pf = platform.system()
     if pf == 'Windows':
         dir = 'win'
@@ -106,13 +494,14 @@ if __name__ == '__main__':
     else:
         pelf = 'pelf' + ext
         sigmake = 'sigmake' + ext
+    pelf = args['pelf'] or pelf
+    sigmake = args['sigmake'] or sigmake
 
     # Create Directory
     pkg_dir = os.path.join(cur_dir, 'pkg')
     lib_dir = os.path.join(cur_dir, 'lib')
     pat_dir = os.path.join(cur_dir, 'pat')
     sig_dir = os.path.join(cur_dir, 'sig')
-    tmp_dir = os.path.join(cur_dir, 'tmp')
     sub_dir = set()
     for name in archive:
         sub_dir.add(os.path.join(cur_dir, 'pkg', archive[name]['pkg']))
@@ -122,171 +511,229 @@ if __name__ == '__main__':
     for dir in sub_dir:
         os.makedirs(dir, exist_ok=True)
 
+    # Download
+    manifest_file = os.path.join(pkg_dir, 'SHA256SUMS')
+    manifest = read_manifest(manifest_file)
+    with concurrent.futures.ThreadPoolExecutor(args['download_jobs']) \
+            as executor:
+        future = {}
+        for name in sorted(archive):
+            url = archive[name]['url']
+            key = archive[name]['pkg'].replace(os.sep, '/') + '/' \
+                + os.path.basename(urllib.parse.urlparse(url).path)
+            if args['mirror']:
+                url = get_mirror_url(args['mirror'], key)
+            file = os.path.join(pkg_dir, *key.split('/'))
+            future[executor.submit(fetch, url, file, manifest.get(key),
+                                   args['verify'])] = (key, url)
+        for fut in concurrent.futures.as_completed(future):
+            key, url = future[fut]
+            try:
+                manifest[key] = fut.result()
+            except Exception as e:
+                print('Download:', url, e, file=sys.stderr)
+    write_manifest(manifest_file, manifest)
+
     # Package
+    build = BuildManifest(os.path.join(cur_dir, 'build.json'))
     table = str.maketrans({c: '-' for c in '!\"#$&\'()*+;<>?[\\]^`{|}~'})
     libname = ('libc', 'libgcc')
     libfile = {ln + '.a': ln for ln in libname}
-    for name in sorted(archive):
-        # Download
-        cpu = archive[name]['cpu']
-        url = archive[name]['url']
-        file = os.path.join(pkg_dir, archive[name]['pkg'],
-                            os.path.basename(urllib.parse.urlparse(url).path))
-        if not os.path.exists(file):
-            subprocess.run(('wget', '-O', file, url))
-
-        # Collect Library
-        if not any(map(lambda f: glob.glob(f),
-                       (os.path.join(lib_dir,
-                                     cpu,
-                                     '_' + ln + '_' + name + '*')
-                        for ln in libname))):
-            # Expand
-            os.makedirs(tmp_dir, exist_ok=True)
-            _, ext = os.path.splitext(file)
-            c = {'.gz': 'z', '.bz2': 'j', '.xz': 'J'}[ext]
-            path = []
-            for f in subprocess.run(('tar', '--warning=no-unknown-keyword',
-                                     '-' + c + 'tf', file),
-                                    stdout=subprocess.PIPE). \
-                    stdout.decode().splitlines():
-                if os.path.basename(f) in libfile:
-                    path.append(f)
-            if path:
-                subprocess.run(['tar', '--warning=no-unknown-keyword',
-                                '-' + c + 'xf', file, '-C', tmp_dir] + path)
-            # Move
-            path = {lf: set() for lf in libfile}
-            for dirpath, _, filename in os.walk(tmp_dir):
-                for file in filename:
-                    p = os.path.join(dirpath, file)
-                    if not os.path.islink(p) and file in libfile:
-                        path[file].add(p)
-            for lf in libfile:
-                count = {}
-                for p in path[lf]:
-                    for i, e in enumerate(p.split(os.sep)):
-                        if i not in count:
-                            count[i] = set()
-                        count[i].add(e)
-                for i in count:
-                    count[i] = len(count[i])
-                for p in path[lf]:
-                    element = [name]
-                    for i, e in enumerate(p.split(os.sep)[:-1]):
-                        if count[i] > 1:
-                            element.append(e)
-                    os.rename(p, os.path.join(lib_dir,
-                                              cpu,
-                                              '_' + libfile[lf] + '_'
-                                              + '-'.join(element).
-                                              translate(table)) + '.a')
-            shutil.rmtree(tmp_dir)
-
-    for cpu, opt in cpu_opt:
+    with concurrent.futures.ThreadPoolExecutor(args['jobs']) as executor:
+        future = {}
+        for name in sorted(archive):
+            cpu = archive[name]['cpu']
+            url = archive[name]['url']
+            key = archive[name]['pkg'].replace(os.sep, '/') + '/' \
+                + os.path.basename(urllib.parse.urlparse(url).path)
+            file = os.path.join(pkg_dir, *key.split('/'))
+            if not os.path.exists(file):
+                continue
+
+            # Collect Library
+            target = os.path.join(lib_dir, cpu, name)
+            lib_key = build.key({file: manifest.get(key)})
+            if not build.is_fresh(target, lib_key, output=True):
+                build.remove(target)
+                future[executor.submit(extract_library, file, name,
+                                       os.path.join(lib_dir, cpu),
+                                       libfile, table)] = \
+                    (file, target, lib_key)
+        for fut in concurrent.futures.as_completed(future):
+            file, target, lib_key = future[fut]
+            try:
+                build.update(target, lib_key, fut.result())
+            except Exception as e:
+                print('Extract:', file, e, file=sys.stderr)
+    build.save()
+
+    # Build
+    pelf_hash = build.digest(get_tool(pelf))
+    sigmake_hash = build.digest(get_tool(sigmake))
+    with concurrent.futures.ThreadPoolExecutor(args['jobs']) as executor:
+        job = {}
+        pattern = {}
+        pending = {}
         # Create Pattern
-        pattern = []
-        libpath = glob.glob(os.path.join(lib_dir, cpu, '*.a'))
-        libpath.sort()
-        for lib in libpath:
-            root, _ = os.path.splitext(lib)
-            name = os.path.basename(root)
-            pat = os.path.join(pat_dir, cpu, name + '.pat')
-            if not os.path.exists(pat):
-                subprocess.run((pelf,) + opt + (lib, pat))
-            if os.path.exists(pat):
-                with open(pat) as f:
-                    s = tuple(f)
-                    if len(s) > 0 and s[-1].strip() == '---':
-                        pattern.append(pat)
-        # Remove Duplicate Patterns
-        pattern.sort()
-        pat_path = pattern.copy()
-        pat_size = {p: os.path.getsize(p) for p in pattern}
-        pat_hash = {}
-        while pat_path:
-            pat = pat_path.pop(0)
-            for p in pat_path.copy():
-                if pat_size[pat] == pat_size[p]:
-                    if pat not in pat_hash:
-                        with open(pat, 'rb') as f:
-                            pat_hash[pat] = hashlib.sha256(f.read()).digest()
-                    if p not in pat_hash:
-                        with open(p, 'rb') as f:
-                            pat_hash[p] = hashlib.sha256(f.read()).digest()
-                    if pat_hash[pat] == pat_hash[p]:
-                        root, _ = os.path.splitext(pat)
-                        with open(p, 'w') as f:
-                            f.write(os.path.basename(root) + '\n')
-                        pattern.remove(p)
-                        pat_path.remove(p)
-        # Create SIgnature
-        for pat in pattern:
-            root, _ = os.path.splitext(pat)
-            name = os.path.basename(root)
-            sig = os.path.join(sig_dir, cpu, name + '.sig')
-            if not os.path.exists(sig):
-                subprocess.run((sigmake, '-r', '-n' + name, pat, sig))
-
-    # Generate Name File
-    re_hex = re.compile(r'-?[\da-fA-F]+')
+        for cpu, opt in cpu_opt:
+            pattern[cpu] = []
+            pending[cpu] = set()
+            libpath = glob.glob(os.path.join(lib_dir, cpu, '*.a'))
+            libpath.sort()
+            stale = set()
+            for lib in libpath:
+                root, _ = os.path.splitext(lib)
+                name = os.path.basename(root)
+                pat = os.path.join(pat_dir, cpu, name + '.pat')
+                pat_key = build.key({lib: build.digest(lib)}, pelf_hash, opt)
+                if not build.is_fresh(pat, pat_key):
+                    stale.add(name)
+                pattern[cpu].append((lib, pat, pat_key))
+            # Duplicate Patterns of the Stale Patterns
+            for lib, pat, pat_key in pattern[cpu]:
+                if os.path.exists(pat) and not is_pattern(pat):
+                    with open(pat) as f:
+                        if f.read().strip() in stale:
+                            stale.add(os.path.basename(
+                                os.path.splitext(pat)[0]))
+            for lib, pat, pat_key in pattern[cpu]:
+                if os.path.basename(os.path.splitext(pat)[0]) in stale:
+                    fut = executor.submit(run_tool, (pelf,) + opt + (lib, pat))
+                    job[fut] = ('pelf', cpu, pat, pat_key)
+                    pending[cpu].add(fut)
+            pattern[cpu] = [pat for _, pat, _ in pattern[cpu]]
+        active = set(job)
+        ready = [cpu for cpu, _ in cpu_opt if not pending[cpu]]
+        failure = 0
+        while ready or active:
+            # Create Signature after Removing Duplicate Patterns of the CPU
+            for cpu in ready:
+                unique = dedup_pattern(pattern[cpu], build,
+                                       args['dedup'] == 'function')
+                for pat in pattern[cpu]:
+                    root, _ = os.path.splitext(pat)
+                    name = os.path.basename(root)
+                    sig = os.path.join(sig_dir, cpu, name + '.sig')
+                    if pat not in unique:
+                        build.remove(sig)
+                        continue
+                    option = ('-r', '-n' + name)
+                    sig_key = build.key({pat: build.digest(pat)},
+                                        sigmake_hash, option)
+                    if not build.is_fresh(sig, sig_key):
+                        fut = executor.submit(run_tool, (sigmake,) + option
+                                              + (pat, sig))
+                        job[fut] = ('sigmake', cpu, sig, sig_key)
+                        active.add(fut)
+            ready = []
+            if active:
+                done, active = concurrent.futures.wait(
+                    active, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    tool, cpu, target, key = job.pop(fut)
+                    try:
+                        code, out = fut.result()
+                    except Exception as e:
+                        code, out = None, str(e)
+                    if code != 0:
+                        failure += 1
+                        print('Fail:', tool, target, code, file=sys.stderr)
+                        if out.strip():
+                            print(out.rstrip(), file=sys.stderr)
+                    elif os.path.exists(target):
+                        build.update(target, key)
+                    if tool == 'pelf':
+                        pending[cpu].discard(fut)
+                        if not pending[cpu]:
+                            ready.append(cpu)
+        if failure:
+            print('Fail:', failure, 'jobs', file=sys.stderr)
+    build.save()
+
+    # ISA Variant of the Signatures from the Objects of the Libraries
+    # (from the modules of the signature if the library does not exist)
+    for cpu, _ in cpu_opt:
+        isa = catalog.scan_isa(os.path.join(sig_dir, cpu))
+        for sig in glob.glob(os.path.join(sig_dir, cpu, '_*_*.sig')):
+            root, _ = os.path.splitext(os.path.basename(sig))
+            lib = os.path.join(lib_dir, cpu, root + '.a')
+            if os.path.exists(lib):
+                isa[root + '.sig'] = catalog.get_library_isa(lib)
+        file = os.path.join(sig_dir, cpu, catalog.ISA_FILE)
+        with open(file + '.part', 'w', newline='\n') as f:
+            json.dump(isa, f, indent=2, sort_keys=True)
+        os.replace(file + '.part', file)
+
+    # Family Signature of the Modules Shared by the Signatures
+    with concurrent.futures.ThreadPoolExecutor(args['jobs']) as executor:
+        job = {}
+        family = {}
+        for cpu, _ in cpu_opt:
+            member = {}
+            for sig in glob.glob(os.path.join(sig_dir, cpu, '_*_*.sig')):
+                root, _ = os.path.splitext(sig)
+                name = os.path.basename(root)
+                pat = os.path.join(pat_dir, cpu, name + '.pat')
+                if os.path.exists(pat) and is_pattern(pat):
+                    member[name + '.sig'] = pat
+            family[cpu] = catalog.get_family(member)
+            for sig in glob.glob(os.path.join(sig_dir, cpu, 'family_*.sig')):
+                if os.path.basename(sig) not in family[cpu]:
+                    build.remove(sig)
+            for pat in glob.glob(os.path.join(pat_dir, cpu, 'family',
+                                              'family_*.pat')):
+                root, _ = os.path.splitext(os.path.basename(pat))
+                if root + '.sig' not in family[cpu]:
+                    build.remove(pat)
+            for n in sorted(family[cpu]):
+                root, _ = os.path.splitext(n)
+                pat = os.path.join(pat_dir, cpu, 'family', root + '.pat')
+                sig = os.path.join(sig_dir, cpu, n)
+                input = sorted(member[m] for m in
+                               catalog.get_member(family[cpu], n))
+                pat_key = build.key({m: build.digest(m) for m in input})
+                if not build.is_fresh(pat, pat_key):
+                    os.makedirs(os.path.dirname(pat), exist_ok=True)
+                    if write_family(pat, input):
+                        build.update(pat, pat_key)
+                    else:
+                        build.remove(pat)
+                if not os.path.exists(pat):
+                    build.remove(sig)
+                    continue
+                option = ('-r', '-n' + root)
+                sig_key = build.key({pat: build.digest(pat)}, sigmake_hash,
+                                    option)
+                if not build.is_fresh(sig, sig_key):
+                    fut = executor.submit(run_tool, (sigmake,) + option
+                                          + (pat, sig))
+                    job[fut] = (sig, sig_key)
+        for fut in concurrent.futures.as_completed(job):
+            sig, sig_key = job[fut]
+            try:
+                code, out = fut.result()
+            except Exception as e:
+                code, out = None, str(e)
+            if code != 0:
+                print('Fail:', 'sigmake', sig, code, file=sys.stderr)
+                if out.strip():
+                    print(out.rstrip(), file=sys.stderr)
+            elif os.path.exists(sig):
+                build.update(sig, sig_key)
+        for cpu, _ in cpu_opt:
+            exist = {n for n in family[cpu]
+                     if os.path.exists(os.path.join(sig_dir, cpu, n))
+                     and build.get(os.path.join(sig_dir, cpu, n))}
+            file = os.path.join(sig_dir, cpu, catalog.FAMILY_FILE)
+            with open(file + '.part', 'w', newline='\n') as f:
+                json.dump(prune_family(family[cpu], exist), f, indent=2,
+                          sort_keys=True)
+            os.replace(file + '.part', file)
+    build.save()
+
+    # Generate Name File from the Changed Patterns
     pattern = []
     for cpu, _ in cpu_opt:
         pattern.extend(glob.glob(os.path.join(pat_dir, cpu, '*.pat')))
-    pattern.sort()
-    file = os.path.join(cur_dir, 'name_alternate.csv')
-    if not os.path.exists(file) or os.path.getmtime(file) \
-            < max(map(lambda p: os.path.getmtime(p), pattern)):
-        symbol = []
-        for pat in pattern:
-            with open(pat) as f:
-                for s in f:
-                    entry = {}
-                    element = s.strip().split()
-                    if len(element) >= 5:
-                        element = element[4:]
-                        while len(element) >= 2:
-                            e = element.pop(0)
-                            if e.startswith(':'):
-                                e = e.lstrip(':').rstrip('@')
-                                if re_hex.fullmatch(e):
-                                    k = int(e, 16)
-                                    if k not in entry:
-                                        entry[k] = set()
-                                    entry[k].add(element.pop(0))
-                    for v in entry.values():
-                        for s in symbol:
-                            if not v.isdisjoint(s):
-                                v.update(s)
-                                s.clear()
-                        while frozenset() in symbol:
-                            symbol.remove(frozenset())
-                        symbol.append(v)
-        symbol = map(lambda sym: sorted(sym,
-                                        key=lambda s: (len(s), s.swapcase())),
-                     symbol)
-        with open(file, 'w') as f:
-            for s in sorted(symbol):
-                f.write(','.join(s) + '\n')
-
-    pattern = tuple(pat for pat in pattern
-                    if os.path.basename(pat).startswith('_libgcc_'))
-    file = os.path.join(cur_dir, 'name_ignore.txt')
-    if not os.path.exists(file) or os.path.getmtime(file) \
-            < max(map(lambda p: os.path.getmtime(p), pattern)):
-        symbol = set()
-        for pat in pattern:
-            with open(pat) as f:
-                for s in f:
-                    element = s.strip().split()
-                    if len(element) >= 5:
-                        element = element[4:]
-                        while len(element) >= 2:
-                            e = element.pop(0)
-                            if e.startswith(':'):
-                                e = e.lstrip(':').rstrip('@')
-                                if re_hex.fullmatch(e):
-                                    symbol.add(element.pop(0))
-        with open(file, 'w') as f:
-            for s in sorted(symbol):
-                f.write(s + '\n')
+    write_name_file(build, sorted(pattern), cur_dir)
+    build.save()
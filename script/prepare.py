@@ -9,11 +9,15 @@ import collections
 import glob
 import json
 import math
+import mmap
 import os
 import re
+import stat
 import struct
 import subprocess
 import sys
+import tempfile
+import time
 try:
     import idaapi
     import idautils
@@ -22,33 +26,163 @@ except ImportError:
     idapro = False
 else:
     idapro = True
+try:
+    import numpy
+except ImportError:
+    npy = False
+else:
+    npy = True
 
 
+CHUNK_SIZE = 1 << 20
 ENTROPY_THRESHOLD = 7.2
+CPU = {3: 'pc', 4: 'mc68k', 8: 'mips', 20: 'ppc', 40: 'arm', 42: 'sh3',
+       62: 'pc'}
+INDEX_MAGIC = b'NIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIIqqqq')
+INDEX_RECORD = struct.Struct('<IIIII')
+INDEX_NONE = 0xffffffff
+
+
+# Byte Histogram
+def histogram(buf):
+    if npy:
+        return numpy.bincount(numpy.frombuffer(buf, dtype=numpy.uint8),
+                              minlength=256).tolist()
+    c = collections.Counter(buf)
+    return [c[i] for i in range(256)]
+
+
+def get_entropy(hist):
+    size = sum(hist)
+    return -sum(x * math.log(x, 2)
+                for x in (float(c) / size for c in hist if c)) if size else 0.0
 
 
 # Entropy
 def entropy(file):
-    size = os.path.getsize(file)
+    hist = [0] * 256
     with open(file, 'rb') as f:
-        ent = -sum(map(lambda x: x * math.log(x, 2),
-                       map(lambda x: float(x) / size,
-                           collections.Counter(f.read()).values())))
-    return ent
+        for buf in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hist = list(map(int.__add__, hist, histogram(buf)))
+    return get_entropy(hist)
 
 
 # Get ELF Attributes
 # 3:pc, 4:mc68k, 8:mips, 20:ppc, 40:arm, 42:sh3, 62:pc
 def get_elf_attr(file):
-    bits = machine = None
+    info = get_elf_info(file)
+    return (info['bits'], info['machine']) if info else (None, None)
+
+
+# Read ELF Header
+def read_elf_header(buf):
+    if len(buf) < 52 or buf[:4] != b'\x7FELF':
+        return None
+    endian = {1: '<', 2: '>'}.get(buf[5])
+    bits = {1: 32, 2: 64}.get(buf[4])
+    if not endian or not bits or bits == 64 and len(buf) < 64:
+        return None
+    addr = 'I' if bits == 32 else 'Q'
+    machine, _, entry, phoff, shoff, flags, _, phentsize, phnum, \
+        shentsize, shnum, shstrndx = \
+        struct.unpack_from(endian + 'HI' + addr * 3 + 'IHHHHHH', buf, 18)
+    return {'endian': endian, 'bits': bits, 'machine': machine,
+            'entry': entry, 'flags': flags,
+            'phoff': phoff, 'phentsize': phentsize, 'phnum': phnum,
+            'shoff': shoff, 'shentsize': shentsize, 'shnum': shnum,
+            'shstrndx': shstrndx}
+
+
+# Read ELF Section Header
+# (name, type, flags, addr, offset, size)
+def read_elf_section(buf, header):
+    ret = []
+    shoff = header['shoff']
+    shentsize = header['shentsize']
+    if shoff and header['shnum'] and shentsize:
+        fmt = header['endian'] + ('IIIIIIIIII' if header['bits'] == 32
+                                  else 'IIQQQQIIQQ')
+        if shentsize < struct.calcsize(fmt):
+            return ret
+        num = min(header['shnum'], (len(buf) - shoff) // shentsize)
+        for i in range(max(num, 0)):
+            ret.append(struct.unpack_from(fmt, buf, shoff + i * shentsize)
+                       [:6])
+        strtab = b''
+        if header['shstrndx'] < len(ret):
+            _, _, _, _, offset, size = ret[header['shstrndx']]
+            strtab = buf[offset:offset + size]
+        for i, (name, *e) in enumerate(ret):
+            ed = strtab.find(b'\0', name)
+            ret[i] = (strtab[name:ed if ed >= 0 else None].
+                      decode(errors='replace'), *e)
+    return ret
+
+
+# Read ELF Program Header
+# (type, flags, offset, vaddr, filesz)
+def read_elf_program(buf, header):
+    ret = []
+    phoff = header['phoff']
+    phentsize = header['phentsize']
+    if phoff and header['phnum'] and phentsize:
+        fmt = header['endian'] + ('IIIIIIII' if header['bits'] == 32
+                                  else 'IIQQQQQQ')
+        if phentsize < struct.calcsize(fmt):
+            return ret
+        num = min(header['phnum'], (len(buf) - phoff) // phentsize)
+        for i in range(max(num, 0)):
+            e = struct.unpack_from(fmt, buf, phoff + i * phentsize)
+            if header['bits'] == 32:
+                p_type, p_offset, p_vaddr, _, p_filesz, _, p_flags, _ = e
+            else:
+                p_type, p_flags, p_offset, p_vaddr, _, p_filesz, _, _ = e
+            ret.append((p_type, p_flags, p_offset, p_vaddr, p_filesz))
+    return ret
+
+
+# Get ELF Information
+# section: (name, type, flags, addr, offset, size)
+# code: (file offset, end of file offset, virtual address)
+def get_elf_info(file):
     with open(file, 'rb') as f:
-        buf = f.read(20)
-        if buf[:4] == b'\x7FELF':
-            endian = {1: '<', 2: '>'}.get(buf[5])
-            if endian:
-                bits = {1: 32, 2: 64}.get(buf[4])
-                machine, = struct.unpack(endian + '18xH', buf)
-    return bits, machine
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+        with buf:
+            header = read_elf_header(buf)
+            if not header:
+                return None
+            section = read_elf_section(buf, header)
+            program = read_elf_program(buf, header)
+    info = {k: header[k] for k in ('bits', 'machine', 'endian', 'entry',
+                                   'flags')}
+    info['section'] = section
+    info['symtab'] = any(s[1] == 2 for s in section)
+    info['dynsym'] = any(s[1] == 11 for s in section)
+    info['static'] = not any(p[0] in (2, 3) for p in program)
+    code = [(offset, offset + size, addr)
+            for _, sh_type, flags, addr, offset, size in section
+            if sh_type != 8 and flags & 0x4 and size]
+    if not code:
+        code = [(offset, offset + size, addr)
+                for p_type, flags, offset, addr, size in program
+                if p_type == 1 and flags & 0x1 and size]
+    info['code'] = sorted(code)
+    return info
+
+
+# Get Executable Area of ELF
+# area: (file offset, end of file offset, virtual address)
+def get_elf_section(file):
+    info = get_elf_info(file)
+    if not info or info['machine'] not in CPU:
+        return None
+    return CPU[info['machine']], info['endian'], info['bits'], \
+        info['entry'], info['code']
 
 
 # Is Packed
@@ -67,38 +201,305 @@ def get_idapro_path():
 
 
 # IDA Python
-def exec_ida(idapro, script, file):
-    subprocess.run((idapro, '-A', '-B', '-c', '-S\"' + script + '\"', file))
-    # 削除
-    for ext in ('.asm', '.i64', '.id0', '.id1',
-                '.id2', '.idb', '.nam', '.til'):
-        f = file + ext
-        if os.path.exists(f):
-            os.remove(f)
+# timing: list to which the launch and exit time of the process is appended
+def exec_ida(idapro, script, file, *args, timeout=None, timing=None):
+    launch = time.time()
+    start = time.perf_counter()
+    ret = None
+    try:
+        ret = subprocess.run((idapro, '-A', '-B', '-c',
+                              '-S\"' + ' '.join((script,) + args) + '\"',
+                              file), timeout=timeout).returncode
+    finally:
+        if timing is not None:
+            timing.append({'launch': launch, 'exit': time.time(),
+                           'time': time.perf_counter() - start,
+                           'code': ret})
+        # 削除
+        for ext in ('.asm', '.i64', '.id0', '.id1',
+                    '.id2', '.idb', '.nam', '.til'):
+            f = file + ext
+            if os.path.exists(f):
+                os.remove(f)
+    return ret
+
+
+# Write File by Renaming a Unique Temporary File in the Same Directory
+# The concurrent processes never share the temporary file.
+# The mode is kept if the file exists, or it is given by the umask.
+def write_atomic(file, data):
+    try:
+        mode = stat.S_IMODE(os.stat(file).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(file) + '_',
+                               suffix='.part',
+                               dir=os.path.dirname(os.path.abspath(file)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, file)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# Size and Modification Time of the Source of Name Index
+def get_index_source(file):
+    try:
+        st = os.stat(file)
+    except OSError:
+        return -1, -1
+    return st.st_size, st.st_mtime_ns
+
+
+# Build Name Index
+# name -> (canonical name of name_alternate.csv, declaration of prepare.txt)
+def build_name_index(alternate, declaration):
+    # Library Function Name
+    libfunc = {}
+    if os.path.exists(alternate):
+        with open(alternate) as f:
+            for s in f:
+                e = s.strip().split(',')
+                libfunc.update({k: e[0] for k in e if k})
+    # Declaration
+    decl = {}
+    if os.path.exists(declaration):
+        with open(declaration) as f:
+            r = re.compile(r'.*?(\w+)\s*\(.*')
+            for s in map(lambda s: s.strip(), f):
+                m = r.fullmatch(s)
+                if m:
+                    decl[m.group(1)] = s
+    if os.path.exists(alternate):
+        with open(alternate) as f:
+            for s in f:
+                e = s.strip().split(',')
+                for n1 in e:
+                    if n1 and n1 not in decl:
+                        for n2 in e:
+                            if n2 in decl:
+                                decl[n1] = decl[n2]
+                                break
+    # Sorted Records and String Blob
+    name = sorted({n.encode() for n in libfunc} | {n.encode() for n in decl})
+    number = {n: i for i, n in enumerate(name)}
+    offset = INDEX_HEADER.size + INDEX_RECORD.size * len(name)
+    blob = bytearray()
+    string = {}
+
+    def add_string(b):
+        if b not in string:
+            string[b] = offset + len(blob)
+            blob.extend(b)
+        return string[b], len(b)
+
+    record = bytearray()
+    for n in name:
+        n_off, n_len = add_string(n)
+        k = n.decode()
+        canon = number[libfunc[k].encode()] if k in libfunc else INDEX_NONE
+        if k in decl:
+            d_off, d_len = add_string(decl[k].encode())
+        else:
+            d_off, d_len = INDEX_NONE, 0
+        record.extend(INDEX_RECORD.pack(n_off, n_len, canon, d_off, d_len))
+    return INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(name),
+                             *get_index_source(alternate),
+                             *get_index_source(declaration)) \
+        + bytes(record) + bytes(blob)
+
+
+# Name Index Mapped from the Compiled File
+class NameIndex:
+    def __init__(self, file, alternate, declaration):
+        source = get_index_source(alternate) + get_index_source(declaration)
+        self.map = None
+        self.buf = None
+        try:
+            with open(file, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            header = INDEX_HEADER.unpack_from(buf, 0)
+            if header[:2] == (INDEX_MAGIC, INDEX_VERSION) \
+                    and header[3:] == source:
+                self.map = buf
+                self.buf = buf
+            else:
+                buf.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        if self.buf is None:
+            # Rebuild (in memory if the file can not be written)
+            self.buf = build_name_index(alternate, declaration)
+            try:
+                write_atomic(file, self.buf)
+            except OSError:
+                pass
+        self.count = INDEX_HEADER.unpack_from(self.buf, 0)[2]
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.map = None
+        self.buf = None
+
+    def get_string(self, off, n):
+        return self.buf[off:off + n].decode()
+
+    def find(self, name):
+        key = name.encode()
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rec = INDEX_RECORD.unpack_from(
+                self.buf, INDEX_HEADER.size + INDEX_RECORD.size * mid)
+            s = self.buf[rec[0]:rec[0] + rec[1]]
+            if s < key:
+                lo = mid + 1
+            elif s > key:
+                hi = mid
+            else:
+                return rec
+        return None
+
+    # Canonical Name of name_alternate.csv
+    def canonical(self, name):
+        rec = self.find(name)
+        if rec is None or rec[2] == INDEX_NONE:
+            return None
+        rec = INDEX_RECORD.unpack_from(
+            self.buf, INDEX_HEADER.size + INDEX_RECORD.size * rec[2])
+        return self.get_string(rec[0], rec[1])
+
+    # Function Declaration of prepare.txt
+    def declaration(self, name):
+        rec = self.find(name)
+        if rec is None or rec[3] == INDEX_NONE:
+            return None
+        return self.get_string(rec[3], rec[4])
+
+
+name_index = None
+
+
+# Cache Directory of the Name Index and the Parsed Declarations
+# "IDAFLIRT_CACHE" if it is set, or the cache directory of the user
+def get_cache_dir():
+    dir = os.environ.get('IDAFLIRT_CACHE')
+    if not dir:
+        if os.name == 'nt':
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(
+                os.path.join('~', 'AppData', 'Local'))
+        else:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(
+                os.path.join('~', '.cache'))
+        dir = os.path.join(base, 'idaflirt-detector')
+    try:
+        os.makedirs(dir, exist_ok=True)
+    except OSError:
+        pass
+    return dir
+
+
+# Get Name Index (loaded at the first call)
+def get_name_index():
+    global name_index
+    if name_index is None:
+        root, _ = os.path.splitext(os.path.abspath(__file__))
+        name_index = NameIndex(os.path.join(get_cache_dir(), 'prepare.idx'),
+                               os.path.join(os.path.dirname(root),
+                                            'name_alternate.csv'),
+                               root + '.txt')
+    return name_index
+
+
+# Analysis Pass
+# Analyzers registered for 'item' are fed from one walk of all segments,
+# for 'name' from the name list and for 'function' from the function list.
+class AnalysisPass:
+    def __init__(self):
+        self.analyzer = {'item': [], 'name': [], 'function': []}
+
+    def register(self, kind, name, analyzer):
+        self.analyzer[kind].append((name, analyzer))
+        pass_timing.setdefault(name, 0.0)
+
+    def feed(self, kind, method, *args):
+        for name, analyzer in self.analyzer[kind]:
+            func = getattr(analyzer, method, None)
+            if func:
+                start = time.perf_counter()
+                func(*args)
+                pass_timing[name] += time.perf_counter() - start
+
+    def run(self):
+        # Segment Walk
+        if self.analyzer['item']:
+            seg = idc.get_first_seg()
+            while seg != idc.BADADDR:
+                ea = idc.get_segm_start(seg)
+                end = idc.get_segm_end(seg)
+                while ea < end:
+                    self.feed('item', 'item', ea, idc.get_full_flags(ea))
+                    ea = idc.get_item_end(ea)
+                self.feed('item', 'segment_end', ea)
+                seg = idc.get_next_seg(seg)
+        # Named Address
+        if self.analyzer['name']:
+            for ea, name in idautils.Names():
+                self.feed('name', 'name', ea, name)
+        # Function
+        if self.analyzer['function']:
+            for ea in idautils.Functions():
+                self.feed('function', 'function', ea)
+        for kind in self.analyzer:
+            self.feed(kind, 'finish')
+
+
+pass_timing = collections.OrderedDict()
+
+
+# Run the Step and Add Elapsed Time
+def timed(name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    pass_timing[name] = pass_timing.get(name, 0.0) \
+        + time.perf_counter() - start
+    return ret
 
 
 # Make functions from independent codes
+class SingleInstructionAnalyzer:
+    def __init__(self):
+        self.st = idc.BADADDR
+
+    def item(self, ea, flags):
+        if idc.is_code(flags) and idc.get_func_flags(ea) == -1:
+            if self.st == idc.BADADDR:
+                self.st = ea
+        elif self.st != idc.BADADDR:
+            for xref in idautils.XrefsTo(ea):
+                if not self.st <= xref.frm < ea:
+                    idc.add_func(self.st, ea)
+                    self.st = idc.BADADDR
+                    break
+
+    def segment_end(self, ea):
+        if self.st != idc.BADADDR:
+            idc.add_func(self.st, ea)
+        self.st = idc.BADADDR
+
+
 def functionalize_single_instruction():
-    seg = idc.get_first_seg()
-    while seg != idc.BADADDR:
-        ea = idc.get_segm_start(seg)
-        end = idc.get_segm_end(seg)
-        st = idc.BADADDR
-        while ea < end:
-            if idc.is_code(idc.get_full_flags(ea)) \
-                    and idc.get_func_flags(ea) == -1:
-                if st == idc.BADADDR:
-                    st = ea
-            elif st != idc.BADADDR:
-                for xref in idautils.XrefsTo(ea):
-                    if not st <= xref.frm < ea:
-                        idc.add_func(st, ea)
-                        st = idc.BADADDR
-                        break
-            ea = idc.get_item_end(ea)
-        if st != idc.BADADDR:
-            idc.add_func(st, ea)
-        seg = idc.get_next_seg(seg)
+    ap = AnalysisPass()
+    ap.register('item', 'functionalize_single_instruction',
+                SingleInstructionAnalyzer())
+    ap.run()
 
 
 # Apply Signature
@@ -120,21 +521,14 @@ def apply_signature():
 
 
 # Normalize Function Name
-def true_up_function_name():
-    # Library Function Name
-    file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                        'name_alternate.csv')
-    libfunc = {}
-    if os.path.exists(file):
-        with open(file) as f:
-            for s in f:
-                e = s.strip().split(',')
-                libfunc.update({k: e[0] for k in e})
-    # Library Flag
-    for ea in idautils.Functions():
+class FunctionNameAnalyzer:
+    def __init__(self):
+        self.index = get_name_index()
+
+    def function(self, ea):
         name = idc.get_name(ea)
-        if name in libfunc:
-            truename = libfunc[name]
+        truename = self.index.canonical(name)
+        if truename:
             if name != truename \
                     and idc.get_name_ea_simple(truename) == idc.BADADDR:
                 idc.set_name(ea, truename)
@@ -143,28 +537,39 @@ def true_up_function_name():
                 idc.set_func_flags(ea, flags | idc.FUNC_LIB)
 
 
+def true_up_function_name():
+    ap = AnalysisPass()
+    ap.register('function', 'true_up_function_name', FunctionNameAnalyzer())
+    ap.run()
+
+
 # Get C main
-def get_c_main():
-    addr = idc.get_name_ea_simple('main')
-    r = re.compile(r'main_([0-9A-Fa-f]+)')
-    seg = idc.get_first_seg()
-    while seg != idc.BADADDR and addr == idc.BADADDR:
-        ea = idc.get_segm_start(seg)
-        end = idc.get_segm_end(seg)
-        while ea < end:
-            name = idc.get_name(ea)
-            m = r.fullmatch(name)
+class CMainAnalyzer:
+    def __init__(self):
+        self.addr = idc.get_name_ea_simple('main')
+        self.r = re.compile(r'main_([0-9A-Fa-f]+)')
+
+    def name(self, ea, name):
+        if self.addr == idc.BADADDR \
+                and not idc.is_tail(idc.get_full_flags(ea)):
+            m = self.r.fullmatch(name)
             if m and int(m.group(1), 16) == ea:
-                addr = ea
-                break
-            ea = idc.get_item_end(ea)
-        seg = idc.get_next_seg(seg)
-    return addr
+                self.addr = ea
+
+
+def get_c_main():
+    cm = CMainAnalyzer()
+    if cm.addr == idc.BADADDR:
+        ap = AnalysisPass()
+        ap.register('name', 'get_c_main', cm)
+        ap.run()
+    return cm.addr
 
 
 # Detect and create main
-def register_c_main():
-    if get_c_main() == idc.BADADDR:
+# It returns the address of the created main or BADADDR.
+def register_c_main(main=None):
+    if (get_c_main() if main is None else main) == idc.BADADDR:
         addr = set()
         ea = idc.get_inf_attr(idc.INF_START_EA)
         ed = idc.get_func_attr(ea, idc.FUNCATTR_END)
@@ -178,20 +583,78 @@ def register_c_main():
         if len(addr) == 1:
             addr = addr.pop()
             idc.set_name(addr, 'main_{:X}'.format(addr))
+            return addr
+    return idc.BADADDR
+
+
+# Type Library
+def get_type_library():
+    return 'gnuunx64' if idaapi.get_inf_structure().is_64bit() else 'gnuunx'
 
 
 # Load Type Library
 def load_type_library():
-    return idc.add_default_til('gnuunx64'
-                               if idaapi.get_inf_structure().is_64bit()
-                               else 'gnuunx')
+    return idc.add_default_til(get_type_library())
+
+
+# Parsed Declaration Cache keyed by IDA Version and Type Library
+class DeclarationCache:
+    def __init__(self, file, library):
+        self.file = file
+        self.data = {}
+        try:
+            with open(file) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self.entry = self.data.setdefault(
+            idaapi.get_kernel_version() + '/' + library, {})
+        self.library = library
+        self.dirty = False
+
+    def save(self):
+        if self.dirty:
+            try:
+                write_atomic(self.file, json.dumps(
+                    self.data, indent=1, sort_keys=True).encode())
+            except OSError:
+                pass
+            self.dirty = False
+
+    # Type Information of idc.parse_decl or None if failed
+    def parse(self, decl):
+        if decl not in self.entry:
+            try:
+                pt = idc.parse_decl(decl, idc.PT_SILENT)  # silent
+            except Exception:
+                pt = None
+            self.entry[decl] = None if pt is None \
+                else [pt[0], pt[1].hex(), pt[2].hex()]
+            self.dirty = True
+        e = self.entry[decl]
+        if e is None:
+            return None
+        return e[0], bytes.fromhex(e[1]), bytes.fromhex(e[2])
+
+
+decl_cache = None
+
+
+# Get Declaration Cache of the Type Library
+def get_decl_cache():
+    global decl_cache
+    library = get_type_library()
+    if decl_cache is None or decl_cache.library != library:
+        decl_cache = DeclarationCache(
+            os.path.join(get_cache_dir(), 'prepare_decl.json'), library)
+    return decl_cache
 
 
 # Set Type
 def set_type(ea, newtype):
     ret = True
     if newtype:
-        pt = idc.parse_decl(newtype, idc.PT_SILENT)  # silent
+        pt = get_decl_cache().parse(newtype)
         if pt is None:
             ret = False
     else:
@@ -200,55 +663,79 @@ def set_type(ea, newtype):
 
 
 # Apply Function Type
+# The declarations are collected from the names and applied at finish().
+class FunctionTypeAnalyzer:
+    def __init__(self, defer=False):
+        self.index = get_name_index()
+        self.r = re.compile(r'(\w+?)(_[0-9a-fA-F]+)')
+        self.defer = defer
+        self.decl = {}
+
+    def name(self, ea, name):
+        name = idc.get_name(ea, idc.GN_VISIBLE)
+        if name:
+            decl = self.index.declaration(name)
+            if not decl:
+                m = self.r.fullmatch(name)
+                if m:
+                    decl = self.index.declaration(m.group(1))
+            if decl:
+                self.decl[ea] = (name, decl)
+
+    def finish(self):
+        if not self.defer:
+            self.apply()
+
+    # Search Matched Name and Apply the Function Declaration
+    # Each declaration is parsed once, and they are applied in address
+    # order skipping the tail of the item typed before.
+    def apply(self):
+        cache = get_decl_cache()
+        pt = {}
+        for name, decl in self.decl.values():
+            if decl not in pt:
+                pt[decl] = cache.parse(decl)
+        cache.save()
+        failure = {}
+        for ea in sorted(self.decl):
+            if idc.is_tail(idc.get_full_flags(ea)):
+                continue
+            name, decl = self.decl[ea]
+            if pt[decl] is None:
+                failure.setdefault(('Parse:', decl), []).append(name)
+                continue
+            try:
+                idc.apply_type(ea, pt[decl])
+            except Exception:
+                failure.setdefault(('Except:', decl), []).append(name)
+        for (reason, decl), name in sorted(failure.items()):
+            print(reason, decl, '(' + ', '.join(sorted(set(name))) + ')')
+        self.decl = {}
+
+
 def apply_function_type():
-    # Read
-    root, _ = os.path.splitext(os.path.abspath(__file__))
-    file = root + '.txt'
-    decl = {}
-    with open(file) as f:
-        r = re.compile(r'.*?(\w+)\s*\(.*')
-        for s in map(lambda s: s.strip(), f):
-            m = r.fullmatch(s)
-            if m:
-                decl[m.group(1)] = s
-    # Library Function Name
-    file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                        'name_alternate.csv')
+    ap = AnalysisPass()
+    ap.register('name', 'apply_function_type', FunctionTypeAnalyzer())
+    ap.run()
+
+
+# Print Elapsed Time of Each Analyzer
+def print_timing():
+    for name, elapsed in pass_timing.items():
+        print('Time: {:36} {:10.3f} s'.format(name, elapsed))
+
+
+# Save Elapsed Time of Each Step to "timing" of the JSON of chksig.py
+def save_timing():
+    root, _ = os.path.splitext(os.path.abspath(idc.get_idb_path()))
+    file = root + '_chksig.json'
+    libjson = {}
     if os.path.exists(file):
         with open(file) as f:
-            for s in f:
-                e = s.strip().split(',')
-                for n1 in e:
-                    if n1 not in decl:
-                        for n2 in e:
-                            if n2 in decl:
-                                decl[n1] = decl[n2]
-                                break
-    # Search Matched Name and Apply the Function Declaration
-    r = re.compile(r'(\w+?)(_[0-9a-fA-F]+)')
-    seg = idc.get_first_seg()
-    while seg != idc.BADADDR:
-        ea = idc.get_segm_start(seg)
-        end = idc.get_segm_end(seg)
-        while ea < end:
-            name = idc.get_name(ea, idc.GN_VISIBLE)
-            if name:
-                api = None
-                if name in decl:
-                    api = name
-                else:
-                    m = r.fullmatch(name)
-                    if m:
-                        n = m.group(1)
-                        if n in decl:
-                            api = n
-                if api:
-                    try:
-                        set_type(ea, decl[api])
-                    except Exception:
-                        print('Except:', name)
-            ea = idc.get_item_end(ea)
-        seg = idc.get_next_seg(seg)
+            libjson = json.load(f)
+    libjson.setdefault('timing', {})['init_idb'] = dict(pass_timing)
+    with open(file, 'w', newline='\n') as f:
+        json.dump(libjson, f, indent=2, sort_keys=True)
 
 
 initialized = False
@@ -258,11 +745,23 @@ def init_idb():
     global initialized
     if not initialized:
         functionalize_single_instruction()
-        apply_signature()
+        timed('apply_signature', apply_signature)
         true_up_function_name()
-        register_c_main()
-        load_type_library()
-        apply_function_type()
+        # Single Pass of the Names for main and Function Type
+        ap = AnalysisPass()
+        cm = CMainAnalyzer()
+        ft = FunctionTypeAnalyzer(defer=True)
+        ap.register('name', 'get_c_main', cm)
+        ap.register('name', 'apply_function_type', ft)
+        ap.run()
+        addr = timed('register_c_main', register_c_main, cm.addr)
+        if addr != idc.BADADDR:
+            ft.name(addr, idc.get_name(addr))
+        timed('load_type_library', load_type_library)
+        timed('apply_function_type', ft.apply)
+        if '--timing' in idc.ARGV:
+            print_timing()
+            save_timing()
         initialized = True
 
 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import triage
+
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS path ('
+          'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, sha256 TEXT)',
+          'CREATE TABLE IF NOT EXISTS result ('
+          'sha256 TEXT, size INTEGER, json TEXT, done INTEGER, time REAL, '
+          'PRIMARY KEY (sha256, size))',
+          'CREATE TABLE IF NOT EXISTS match ('
+          'sha256 TEXT, size INTEGER, library TEXT, signame TEXT, '
+          'PRIMARY KEY (sha256, size, library))',
+          'CREATE INDEX IF NOT EXISTS match_signame ON match (signame)',
+          'CREATE INDEX IF NOT EXISTS path_sha256 ON path (sha256, size)')
+BATCH_SIZE = 500
+
+
+# JSON File of chksig.py next to the Sample
+def get_json_file(path):
+    root, _ = os.path.splitext(os.path.abspath(path))
+    return root + '_chksig.json'
+
+
+# Results Store of chksig.py keyed by SHA-256 and Size of the Sample
+# Each record is written in one transaction, so the processes sharing the
+# file see either the old or the new record.
+class ResultStore:
+    def __init__(self, file):
+        self.db = sqlite3.connect(file, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for s in SCHEMA:
+            self.db.execute(s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    # Batch Lookup of the Files which have "result"
+    # The files whose size and modification time are changed are excluded.
+    def lookup(self, path):
+        stat = {}
+        for p in path:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            stat[os.path.abspath(p)] = (p, st.st_size, st.st_mtime_ns)
+        ret = set()
+        name = list(stat)
+        for i in range(0, len(name), BATCH_SIZE):
+            batch = name[i:i + BATCH_SIZE]
+            for p, size, mtime in self.db.execute(
+                    'SELECT path.path, path.size, path.mtime FROM path '
+                    'JOIN result ON result.sha256 = path.sha256 '
+                    'AND result.size = path.size AND result.done '
+                    'WHERE path.path IN (' + ','.join('?' * len(batch))
+                    + ')', batch):
+                if stat[p][1:] == (size, mtime):
+                    ret.add(stat[p][0])
+        return ret
+
+    # Store the JSON of the File
+    def store(self, path, libjson, sha256=None):
+        st = os.stat(path)
+        sha256 = sha256 or triage.get_hash(path)
+        key = (sha256, st.st_size)
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute('INSERT OR REPLACE INTO path VALUES (?, ?, ?, ?)',
+                            (os.path.abspath(path), st.st_size,
+                             st.st_mtime_ns, sha256))
+            self.db.execute('INSERT OR REPLACE INTO result VALUES '
+                            '(?, ?, ?, ?, ?)',
+                            key + (json.dumps(libjson, sort_keys=True),
+                                   int('result' in libjson), time.time()))
+            self.db.execute('DELETE FROM match WHERE sha256 = ? AND size = ?',
+                            key)
+            self.db.executemany('INSERT INTO match VALUES (?, ?, ?, ?)',
+                                (key + (k, v) for k, v in
+                                 libjson.get('result', {}).items() if v))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+
+    # JSON of the Sample
+    def get(self, sha256, size):
+        for s, in self.db.execute('SELECT json FROM result '
+                                  'WHERE sha256 = ? AND size = ?',
+                                  (sha256, size)):
+            return json.loads(s)
+        return None
+
+    # Samples Matched to the Signature: [(sha256, size, [path])]
+    def query(self, signame):
+        ret = []
+        for sha256, size in self.db.execute(
+                'SELECT sha256, size FROM match WHERE signame = ? '
+                'ORDER BY sha256, size', (signame,)):
+            ret.append((sha256, size, self.get_path(sha256, size)))
+        return ret
+
+    def get_path(self, sha256, size):
+        return [p for p, in self.db.execute(
+            'SELECT path FROM path WHERE sha256 = ? AND size = ? '
+            'ORDER BY path', (sha256, size))]
+
+    # All Records: (sha256, size, [path], JSON)
+    def iter(self):
+        for sha256, size, s in self.db.execute(
+                'SELECT sha256, size, json FROM result ORDER BY sha256, size'):
+            yield sha256, size, self.get_path(sha256, size), json.loads(s)
+
+    # Number of the Samples of Each Signature
+    def count(self):
+        return self.db.execute('SELECT library, signame, COUNT(*) FROM match '
+                               'GROUP BY library, signame '
+                               'ORDER BY library, signame').fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Results Store.')
+    parser.add_argument('store', help='results store file')
+    parser.add_argument('--import', dest='import_', nargs='+',
+                        metavar='PATH', help='import JSON of the samples')
+    parser.add_argument('--query', metavar='SIG',
+                        help='print samples matched to the signature')
+    parser.add_argument('--export', metavar='FILE',
+                        help='export records as JSON Lines ("-": stdout)')
+    parser.add_argument('--export-json', action='store_true',
+                        help='write JSON next to each sample')
+    args = vars(parser.parse_args())
+    with ResultStore(args['store']) as store:
+        for path in (p for arg in args['import_'] or ()
+                     for p in glob.glob(arg)):
+            file = get_json_file(path)
+            if os.path.isfile(path) and os.path.exists(file):
+                with open(file) as f:
+                    store.store(path, json.load(f))
+        if args['query']:
+            for sha256, size, path in store.query(args['query']):
+                print(sha256, size, *path)
+        if args['export']:
+            f = sys.stdout if args['export'] == '-' \
+                else open(args['export'], 'w', newline='\n')
+            try:
+                for sha256, size, path, libjson in store.iter():
+                    f.write(json.dumps({'sha256': sha256, 'size': size,
+                                        'path': path, 'json': libjson},
+                                       sort_keys=True) + '\n')
+            finally:
+                if f is not sys.stdout:
+                    f.close()
+        if args['export_json']:
+            for _, _, path, libjson in store.iter():
+                for p in path:
+                    if os.path.exists(p):
+                        with open(get_json_file(p), 'w', newline='\n') as f:
+                            json.dump(libjson, f, indent=2, sort_keys=True)
+        if not (args['query'] or args['export']):
+            for library, signame, count in store.count():
+                print('{} {}: {}'.format(library, signame, count))
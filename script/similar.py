@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+try:
+    import numpy
+except ImportError:
+    npy = False
+else:
+    npy = True
+
+import alias
+import patfile
+import pkg2sig
+
+
+PRIME = (1 << 31) - 1
+SIMILAR_FILE = 'similar.json'
+
+
+# Functions of the Pattern File (hash of each module line)
+def get_feature(file):
+    return {int.from_bytes(hashlib.blake2b(m.line, digest_size=8).digest(),
+                           'little') % PRIME
+            for m in patfile.PatternReader(file)}
+
+
+# MinHash by the Universal Hash Functions (a * x + b) mod PRIME
+class MinHash:
+    def __init__(self, num_perm=128, seed=0):
+        rnd = random.Random(seed)
+        self.a = [rnd.randrange(1, PRIME) for _ in range(num_perm)]
+        self.b = [rnd.randrange(0, PRIME) for _ in range(num_perm)]
+
+    def signature(self, feature):
+        if not feature:
+            return (PRIME,) * len(self.a)
+        if npy:
+            x = numpy.fromiter(feature, dtype=numpy.uint64, count=len(feature))
+            a = numpy.array(self.a, dtype=numpy.uint64)[:, None]
+            b = numpy.array(self.b, dtype=numpy.uint64)[:, None]
+            return tuple(((a * x + b) % PRIME).min(axis=1).tolist())
+        return tuple(min((a * x + b) % PRIME for x in feature)
+                     for a, b in zip(self.a, self.b))
+
+
+# Candidate Pairs of the Signatures Sharing a Band
+def get_candidate(signature, band):
+    candidate = set()
+    for i in range(band):
+        bucket = {}
+        for name, s in signature.items():
+            row = len(s) // band
+            bucket.setdefault(s[i * row:(i + 1) * row], []).append(name)
+        for member in bucket.values():
+            member.sort()
+            for j, n in enumerate(member):
+                candidate.update((n, m) for m in member[j + 1:])
+    return candidate
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# Clusters of the Patterns whose Similarity is Not Less than the Threshold
+# [{'representative': name, 'member': {name: similarity to representative}}]
+# The representative has the greatest sum of the similarities in the group.
+# A member is similar to the representative itself (not by a chain of the
+# similar pairs); the rest of the group is clustered again.
+def get_cluster(feature, threshold, num_perm=128, band=32, seed=0):
+    minhash = MinHash(num_perm, seed)
+    signature = {n: minhash.signature(f) for n, f in feature.items()}
+    similarity = {}
+    for a, b in get_candidate(signature, band):
+        s = jaccard(feature[a], feature[b])
+        if s >= threshold:
+            similarity[a, b] = similarity[b, a] = s
+    graph = alias.AliasGraph()
+    graph.add(None, (pair for pair in similarity))
+    cluster = []
+    for group in graph.group():
+        group = sorted(group)
+        while len(group) > 1:
+            representative = max(group, key=lambda n: sum(
+                similarity.get((n, m), 0) for m in group))
+            member = {m: 1.0 if m == representative else
+                      jaccard(feature[representative], feature[m])
+                      for m in group}
+            member = {m: s for m, s in member.items() if s >= threshold}
+            if len(member) > 1:
+                cluster.append({'representative': representative,
+                                'member': member})
+            group = [m for m in group if m not in member]
+    cluster.sort(key=lambda c: c['representative'])
+    return cluster
+
+
+# Signatures of the Representatives and the Patterns not in any Cluster
+# {signature: [member signature]}
+def get_mapping(name, cluster):
+    mapping = {}
+    clustered = set()
+    for c in cluster:
+        root, _ = os.path.splitext(c['representative'])
+        mapping[root + '.sig'] = sorted(os.path.splitext(m)[0] + '.sig'
+                                        for m in c['member'])
+        clustered.update(c['member'])
+    for n in name:
+        if n not in clustered:
+            root, _ = os.path.splitext(n)
+            mapping[root + '.sig'] = [root + '.sig']
+    return mapping
+
+
+if __name__ == '__main__':
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Similar Signatures.')
+    parser.add_argument('--pat', default=os.path.join(cur_dir, 'pat'),
+                        help='pattern directory of pkg2sig.py')
+    parser.add_argument('--sig', default=os.path.join(cur_dir, 'sig'),
+                        help='signature directory of pkg2sig.py')
+    parser.add_argument('-t', '--threshold', type=float, default=0.9,
+                        help='Jaccard similarity of the functions')
+    parser.add_argument('--num-perm', type=int, default=128,
+                        help='number of MinHash permutations')
+    parser.add_argument('--band', type=int, default=32,
+                        help='number of LSH bands')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of MinHash')
+    parser.add_argument('-o', '--output',
+                        help='directory of representative signatures')
+    args = vars(parser.parse_args())
+    if args['num_perm'] % args['band']:
+        sys.exit('number of permutations must be a multiple of bands')
+    similar = {}
+    for cpu in sorted(os.listdir(args['pat'])):
+        pattern = sorted(p for p in glob.glob(os.path.join(args['pat'], cpu,
+                                                           '_*_*.pat'))
+                         if pkg2sig.is_pattern(p))
+        if not pattern:
+            continue
+        feature = {os.path.basename(p): get_feature(p) for p in pattern}
+        cluster = get_cluster(feature, args['threshold'], args['num_perm'],
+                              args['band'], args['seed'])
+        for c in cluster:
+            print(cpu, c['representative'], len(c['member']))
+            for m, s in sorted(c['member'].items()):
+                if m != c['representative']:
+                    print(' ', m, '{:.3f}'.format(s))
+        print(cpu, 'patterns', len(pattern), 'clusters', len(cluster),
+              'signatures', len(pattern) - sum(len(c['member']) - 1
+                                               for c in cluster))
+        similar[cpu] = get_mapping(feature, cluster)
+    if args['output']:
+        for cpu, mapping in similar.items():
+            os.makedirs(os.path.join(args['output'], cpu), exist_ok=True)
+            for sig in mapping:
+                src = os.path.join(args['sig'], cpu, sig)
+                if os.path.exists(src):
+                    shutil.copy2(src, os.path.join(args['output'], cpu, sig))
+                else:
+                    print('Missing:', src, file=sys.stderr)
+        with open(os.path.join(args['output'], SIMILAR_FILE), 'w',
+                  newline='\n') as f:
+            json.dump(similar, f, indent=2, sort_keys=True)
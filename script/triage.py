@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# idaflirt-detector
+# https://github.com/SecureBrain/idaflirt-detector
+# Copyright (c) 2022 SecureBrain
+
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+
+import prepare
+
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS path ('
+          'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, sha256 TEXT)',
+          'CREATE TABLE IF NOT EXISTS triage ('
+          'sha256 TEXT, size INTEGER, bits INTEGER, machine INTEGER, '
+          'strip INTEGER, static INTEGER, entropy REAL, skip TEXT, '
+          'time REAL, PRIMARY KEY (sha256, size))')
+COLUMN = ('sha256', 'size', 'bits', 'machine', 'strip', 'static', 'entropy',
+          'skip')
+BATCH_SIZE = 500
+COMMIT_SIZE = 1000
+
+
+# SHA-256 of File
+def get_hash(file):
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for buf in iter(lambda: f.read(prepare.CHUNK_SIZE), b''):
+            h.update(buf)
+    return h.hexdigest()
+
+
+# Triage Cache keyed by SHA-256 and Size
+class TriageCache:
+    def __init__(self, file):
+        self.db = sqlite3.connect(file, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for s in SCHEMA:
+            self.db.execute(s)
+        self.db.commit()
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # Batch Lookup of the Files whose Size and Modification Time are Same
+    def lookup(self, path):
+        stat = {}
+        for p in path:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            stat[os.path.abspath(p)] = (p, st.st_size, st.st_mtime_ns)
+        key = {}
+        name = list(stat)
+        for i in range(0, len(name), BATCH_SIZE):
+            batch = name[i:i + BATCH_SIZE]
+            for p, size, mtime, sha256 in self.db.execute(
+                    'SELECT path, size, mtime, sha256 FROM path '
+                    'WHERE path IN (' + ','.join('?' * len(batch)) + ')',
+                    batch):
+                if stat[p][1:] == (size, mtime):
+                    key.setdefault((sha256, size), []).append(stat[p][0])
+        ret = {}
+        now = time.time()
+        k = list(key)
+        for i in range(0, len(k), BATCH_SIZE):
+            batch = k[i:i + BATCH_SIZE]
+            for row in self.db.execute(
+                    'SELECT ' + ', '.join(COLUMN) + ' FROM triage '
+                    'WHERE ' + ' OR '.join(('(sha256 = ? AND size = ?)',)
+                                           * len(batch)),
+                    [e for kk in batch for e in kk]):
+                record = dict(zip(COLUMN, row))
+                for p in key[row[0], row[1]]:
+                    ret[p] = dict(record)
+            self.db.executemany('UPDATE triage SET time = ? '
+                                'WHERE sha256 = ? AND size = ?',
+                                ((now,) + kk for kk in batch))
+        self.db.commit()
+        return ret
+
+    # Store the Record of the File
+    def store(self, path, record):
+        st = os.stat(path)
+        self.db.execute('INSERT OR REPLACE INTO path VALUES (?, ?, ?, ?)',
+                        (os.path.abspath(path), st.st_size, st.st_mtime_ns,
+                         record['sha256']))
+        self.db.execute('INSERT OR REPLACE INTO triage VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        tuple(record.get(c) for c in COLUMN) + (time.time(),))
+        self.pending += 1
+        if self.pending >= COMMIT_SIZE:
+            self.db.commit()
+            self.pending = 0
+
+    # Evict the Records not Used for the Seconds
+    def evict(self, age):
+        cur = self.db.execute('DELETE FROM triage WHERE time < ?',
+                              (time.time() - age,))
+        self.db.execute('DELETE FROM path WHERE NOT EXISTS '
+                        '(SELECT 1 FROM triage WHERE '
+                        'triage.sha256 = path.sha256 '
+                        'AND triage.size = path.size)')
+        self.db.commit()
+        return cur.rowcount
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Triage Cache.')
+    parser.add_argument('cache', help='cache file')
+    parser.add_argument('--evict', type=float, metavar='DAYS',
+                        help='evict records not used for the days')
+    args = vars(parser.parse_args())
+    with TriageCache(args['cache']) as cache:
+        if args['evict'] is not None:
+            print('Evict:', cache.evict(args['evict'] * 86400))
+        for skip, count in cache.db.execute(
+                'SELECT skip, COUNT(*) FROM triage GROUP BY skip'):
+            print('{}: {}'.format(skip or 'target', count))
@@ -0,0 +1,6 @@
+import os
+import sys
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'script')
+sys.path.insert(0, os.path.abspath(SCRIPT_DIR))
@@ -0,0 +1,94 @@
+import os
+import struct
+
+import benchmark
+import catalog
+from conftest import SCRIPT_DIR
+
+EF_ARM_EABI_VER5 = 0x05000000
+SIG_DIR = os.path.join(SCRIPT_DIR, os.pardir, 'deliverable', 'sig')
+
+
+# ELF Header of the Relocatable Object
+def get_object(machine, flags, bits=32, endian='<'):
+    addr = 'I' if bits == 32 else 'Q'
+    buf = b'\x7FELF' + bytes((1 if bits == 32 else 2,
+                              1 if endian == '<' else 2, 1)) + bytes(9)
+    buf += struct.pack(endian + 'HHI' + addr * 3 + 'IHHHHHH', 1, machine, 1,
+                       0, 0, 0, flags, 52 if bits == 32 else 64, 0, 0, 40,
+                       0, 0)
+    return buf + bytes(15)
+
+
+# ar Archive of the Members (with the symbol table as GNU ar)
+def write_library(file, member):
+    with open(file, 'wb') as f:
+        f.write(catalog.AR_MAGIC)
+        for name, data in [('/', b'\0' * 5)] + member:
+            f.write('{:16}{:12}{:6}{:6}{:8}{:10}`\n'.format(
+                name, 0, 0, 0, 644, len(data)).encode())
+            f.write(data + b'\n' * (len(data) % 2))
+
+
+def test_library_isa(tmp_path):
+    file = str(tmp_path / 'libc.a')
+    write_library(file, [('a.o/', get_object(40, EF_ARM_EABI_VER5)),
+                         ('b.o/', get_object(40, EF_ARM_EABI_VER5))])
+    assert catalog.get_library_isa(file) == 'eabi'
+    write_library(file, [('a.o/', get_object(40, 0)),
+                         ('b.o/', get_object(40, 0))])
+    assert catalog.get_library_isa(file) == 'oabi'
+    write_library(file, [('a.o/', get_object(40, 0)),
+                         ('b.o/', get_object(40, EF_ARM_EABI_VER5))])
+    assert catalog.get_library_isa(file) is None
+    write_library(file, [('a.o/', get_object(8, 0, endian='>'))])
+    assert catalog.get_library_isa(file) == 'mips32'
+    write_library(file, [('a.o/', get_object(3, 0))])
+    assert catalog.get_library_isa(file) is None
+    with open(file, 'w') as f:
+        f.write('---\n')
+    assert catalog.get_library_isa(file) is None
+
+
+def test_compatible():
+    entry = {'label': 'armv5l', 'endian': 'little', 'bits': 32, 'isa': None,
+             'uclibc': None}
+    oabi = {'endian': 'little', 'bits': 32, 'isa': 'oabi', 'uclibc': set()}
+    # The ISA variant is not assumed from the label
+    assert catalog.is_compatible(entry, oabi)
+    assert not catalog.is_compatible(dict(entry, isa='eabi'), oabi)
+    assert catalog.is_compatible(dict(entry, isa='oabi'), oabi)
+    assert not catalog.is_compatible(dict(entry, endian='big'), oabi)
+    assert catalog.is_compatible(dict(entry, label=None), oabi)
+    entry = dict(entry, uclibc='0.9.30')
+    assert catalog.is_compatible(entry, oabi)
+    assert catalog.is_compatible(entry, dict(oabi, uclibc={'0.9.30'}))
+    assert not catalog.is_compatible(entry, dict(oabi, uclibc={'0.9.30.1'}))
+
+
+# ISA Variants of the Shipped Signatures from their Modules
+def test_signature_isa():
+    for cpu in ('arm', 'mips'):
+        sig_dir = os.path.join(SIG_DIR, cpu)
+        isa = catalog.scan_isa(sig_dir)
+        assert isa == catalog.load_isa(sig_dir)
+        for name, v in isa.items():
+            label = catalog.get_entry(os.path.join(sig_dir, name))['label']
+            assert v == {'armv4l': 'oabi', 'armv4tl': 'eabi',
+                         'armv5l': 'oabi', 'mips64': 'mips64'}.get(
+                             label, 'mips32' if cpu == 'mips' else None)
+
+
+# Shortlist by the Version of uClibc in the Sample
+def test_shortlist_version(tmp_path):
+    file = str(tmp_path / 'sample')
+    benchmark.write_elf(file, 40, 32, '<', b'\0uClibc 0.9.30.1\0' * 4)
+    scan = catalog.prescan(file)
+    assert scan['isa'] == 'oabi' and scan['uclibc'] == {'0.9.30.1'}
+    shortlist = catalog.get_shortlist(file, SIG_DIR)
+    entry = catalog.get_catalog(os.path.join(SIG_DIR, 'arm'))
+    assert shortlist and all(entry[n]['isa'] == 'oabi' for n in shortlist)
+    assert '_libc_firmware-0.9.30-armv4l.sig' not in shortlist
+    assert '_libc_aboriginal-1.2.4-armv4l.sig' in shortlist
+    assert [entry[n]['uclibc'] for n in shortlist[:2]] == ['0.9.30.1'] * 2
+    assert all(entry[n]['uclibc'] is None for n in shortlist[2:])
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+from conftest import SCRIPT_DIR
+
+CHKSIG = os.path.join(SCRIPT_DIR, 'chksig.py')
+
+# Stub of IDA Pro which writes the estimate from the content of the sample
+STUB_IDA = '''#!{python}
+import hashlib
+import json
+import os
+import sys
+
+file = sys.argv[-1]
+root, _ = os.path.splitext(file)
+with open(file, 'rb') as f:
+    h = hashlib.sha256(f.read()).digest()
+estimate = {{'_libc_stub-1.0-armv4l.sig': h[0] % 8,
+             '_libc_stub-1.1-armv4l.sig': h[1] % 8,
+             '_libgcc_stub-1.0-armv4l.sig': h[2] % 8}}
+result = {{}}
+for ln in ('_libc_', '_libgcc_'):
+    name = [n for n in sorted(estimate) if n.startswith(ln)
+            and estimate[n] > 1]
+    result[ln] = max(name, key=lambda n: estimate[n]) if name else None
+with open(root + '_chksig.json', 'w') as f:
+    json.dump({{'estimate': estimate, 'result': result,
+               'option': sys.argv[-2]}}, f)
+'''
+
+
+@pytest.fixture
+def stub_ida(tmp_path):
+    path = tmp_path / 'idat'
+    path.write_text(STUB_IDA.format(python=sys.executable))
+    path.chmod(0o755)
+    return str(path)
+
+
+# Samples of ARM (some are the same content), x86 and non-stripped ELF
+def write_sample(dir):
+    os.makedirs(dir)
+    rnd = random.Random(0)
+    for i in range(6):
+        benchmark.write_elf(os.path.join(dir, 'arm{}'.format(i)), 40, 32,
+                            '<', benchmark.get_payload(rnd, 'code', 4096))
+    shutil.copyfile(os.path.join(dir, 'arm0'), os.path.join(dir, 'copy0'))
+    benchmark.write_elf(os.path.join(dir, 'pc'), 3, 32, '<',
+                        benchmark.get_payload(rnd, 'code', 4096))
+    benchmark.write_elf(os.path.join(dir, 'symtab'), 40, 32, '<',
+                        benchmark.get_payload(rnd, 'code', 4096),
+                        symtab=True)
+
+
+def run_chksig(dir, stub_ida, *opt):
+    sample = sorted(os.path.join(dir, n) for n in os.listdir(dir)
+                    if not n.endswith('.json'))
+    subprocess.run((sys.executable, CHKSIG, '--idapro', stub_ida) + opt
+                   + tuple(sample), check=True, stdout=subprocess.PIPE)
+    ret = {}
+    for n in sorted(os.listdir(dir)):
+        if n.endswith('_chksig.json'):
+            with open(os.path.join(dir, n)) as f:
+                libjson = json.load(f)
+            libjson.pop('duplicate', None)
+            ret[n] = libjson
+    return ret
+
+
+def test_parallel_equals_serial(tmp_path, stub_ida):
+    write_sample(tmp_path / 'serial')
+    write_sample(tmp_path / 'parallel')
+    serial = run_chksig(tmp_path / 'serial', stub_ida)
+    parallel = run_chksig(tmp_path / 'parallel', stub_ida, '-j', '3',
+                          '--scratch', str(tmp_path))
+    assert len(serial) == 9
+    assert serial['symtab_chksig.json'] == {'result': {}}
+    assert serial['copy0_chksig.json'] == serial['arm0_chksig.json']
+    assert parallel == serial
+    # No scratch directory is left
+    assert sorted(os.listdir(tmp_path)) == ['idat', 'parallel', 'serial']
+
+
+def test_parallel_resume(tmp_path, stub_ida):
+    write_sample(tmp_path / 'sample')
+    first = run_chksig(tmp_path / 'sample', stub_ida, '-j', '2')
+    for n in first:
+        if first[n].get('estimate'):
+            first[n]['estimate']['_libc_stub-1.0-armv4l.sig'] = 100
+            with open(os.path.join(tmp_path, 'sample', n), 'w') as f:
+                json.dump(first[n], f)
+    assert run_chksig(tmp_path / 'sample', stub_ida, '-j', '2') == first
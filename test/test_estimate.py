@@ -0,0 +1,136 @@
+import os
+import random
+
+import pytest
+
+import benchmark
+import catalog
+import chksig
+import fakeida
+import flirt
+from conftest import SCRIPT_DIR
+
+SIG_DIR = os.path.join(SCRIPT_DIR, os.pardir, 'deliverable', 'sig')
+SAMPLE_SIG = '_libc_aboriginal-1.2.5-armv4l.sig'
+BASE = 0x8000
+
+
+# Functions Matching the Modules without CRC of the Signature
+# The variant bytes are zero, and the modules are aligned by 4 bytes.
+def get_function(file, limit=64):
+    ret = []
+    stack = [(flirt.load(file).root, b'')]
+    while stack and len(ret) < limit:
+        node, lead = stack.pop()
+        for m in node.modules:
+            if m.crc_length or not m.public or not lead.strip(b'\0'):
+                continue
+            buf = bytearray(lead.ljust(flirt.PATTERN_SIZE, b'\0'))
+            for offset, value in m.tail:
+                buf.extend(bytes(flirt.PATTERN_SIZE + offset + 1 - len(buf)))
+                buf[flirt.PATTERN_SIZE + offset] = value
+            buf.extend(bytes(max(m.length - len(buf), 0)))
+            buf.extend(bytes(-len(buf) % 4))
+            ret.append(bytes(buf))
+        for child in reversed(node.children):
+            stack.append((child, lead + child.value.to_bytes(child.length,
+                                                             'big')))
+    return ret
+
+
+@pytest.fixture(scope='module')
+def function():
+    return get_function(os.path.join(SIG_DIR, 'arm', SAMPLE_SIG))
+
+
+# Fake Database of the Functions in a Segment
+def get_database(function, sig_dir=os.path.join(SIG_DIR, 'arm')):
+    db = fakeida.Database('ARM', 32, BASE)
+    ea = BASE
+    data = b''.join(function)
+    db.add_segment(BASE, BASE + len(data), data)
+    for f in function:
+        db.add_func(ea, ea + len(f))
+        ea += len(f)
+    db.sig_dir = sig_dir
+    return db
+
+
+@pytest.fixture
+def database(function):
+    db = get_database(function)
+    with fakeida.install(db, chksig):
+        yield db
+
+
+def test_bounded_equals_exhaustive(database):
+    signame = sorted(n for n in os.listdir(database.sig_dir)
+                     if n.endswith('.sig'))
+    exhaustive = chksig.estimate_apply(signame)
+    assert exhaustive[chksig.get_result(exhaustive)['_libc_']] > 1
+    database.signature = []
+    bound = flirt.get_bound({n: flirt.load(os.path.join(database.sig_dir, n))
+                             for n in signame}, chksig.get_segment())
+    assert all(bound[n] >= exhaustive[n] for n in signame)
+    estimate, skip = chksig.estimate_bounded(signame, bound, {})
+    assert chksig.get_result(estimate) == chksig.get_result(exhaustive)
+    assert all(estimate[n] == exhaustive[n] for n in estimate)
+    assert not set(skip) & set(estimate)
+    assert len(database.signature) == len(estimate)
+    assert any(v['reason'] == 'bound' for v in skip.values())
+
+
+def test_single_pass_equals_apply(database):
+    signame = sorted(n for n in os.listdir(database.sig_dir)
+                     if n.endswith('.sig'))
+    single = chksig.estimate_single_pass(database.sig_dir, signame)
+    assert database.signature == []
+    estimate = chksig.estimate_apply(signame)
+    assert sum(v > 0 for v in estimate.values()) > 1
+    assert single == estimate
+
+
+# Random Databases of the Functions of the Signatures and Random Bytes
+@pytest.mark.parametrize('seed', range(3))
+def test_bounded_random(seed):
+    sig_dir = os.path.join(SIG_DIR, 'arm')
+    signame = sorted(n for n in os.listdir(sig_dir) if n.endswith('.sig'))
+    signature = {n: flirt.load(os.path.join(sig_dir, n)) for n in signame}
+    rnd = random.Random(seed)
+    function = []
+    for n in rnd.sample(signame, 4):
+        f = get_function(os.path.join(sig_dir, n))
+        function += rnd.sample(f, rnd.randint(0, len(f)))
+    function += [rnd.getrandbits(8 * 64).to_bytes(64, 'little')
+                 for _ in range(8)]
+    rnd.shuffle(function)
+    applied = []
+
+    def func(name):
+        applied.extend(name)
+        return chksig.estimate_apply(name)
+
+    with fakeida.install(get_database(function, sig_dir), chksig):
+        exhaustive = chksig.estimate_apply(signame)
+        bound = flirt.get_bound(signature, chksig.get_segment())
+        estimate, skip = chksig.estimate_bounded(signame, bound, {}, func)
+    assert all(bound[n] >= exhaustive[n] for n in signame)
+    assert chksig.get_result(estimate) == chksig.get_result(exhaustive)
+    assert sorted(applied) == sorted(estimate)
+    assert set(estimate) | set(skip) == set(signame)
+    assert any(v['reason'] == 'bound' for v in skip.values())
+
+
+def test_shortlist_equals_full_catalog(tmp_path, function):
+    # OABI sample of the functions
+    file = str(tmp_path / 'sample')
+    benchmark.write_elf(file, 40, 32, '<', b''.join(function))
+    shortlist = catalog.get_shortlist(file, SIG_DIR)
+    isa = catalog.load_isa(os.path.join(SIG_DIR, 'arm'))
+    assert shortlist and len(shortlist) < len(isa)
+    assert SAMPLE_SIG in shortlist
+    full = flirt.estimate(file, SIG_DIR)
+    estimate = flirt.estimate(file, SIG_DIR, shortlist)
+    assert full[chksig.get_result(full)['_libc_']] > 1
+    assert chksig.get_result(estimate) == chksig.get_result(full)
+    assert all(estimate[n] == full[n] for n in estimate)
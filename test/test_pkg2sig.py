@@ -0,0 +1,316 @@
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+
+import pytest
+
+import pkg2sig
+from conftest import SCRIPT_DIR
+
+CONTENT = bytes(range(256)) * 1024
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    request_range = []
+
+    def do_GET(self):
+        data = CONTENT
+        header = self.headers.get('Range')
+        self.request_range.append(header)
+        if header:
+            start = int(header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(data) - 1, len(data)))
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    RangeHandler.request_range = []
+    httpd = http.server.HTTPServer(('127.0.0.1', 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(pkg2sig.time, 'sleep', lambda s: None)
+
+
+def test_download(tmp_path, server):
+    file = str(tmp_path / 'pkg.tar.gz')
+    h = pkg2sig.download(server + 'pkg.tar.gz', file)
+    assert h == hashlib.sha256(CONTENT).hexdigest()
+    assert open(file, 'rb').read() == CONTENT
+    assert not os.path.exists(file + '.part')
+    assert RangeHandler.request_range == [None]
+
+
+def test_download_resume(tmp_path, server):
+    file = str(tmp_path / 'pkg.tar.gz')
+    with open(file + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+    pkg2sig.download(server + 'pkg.tar.gz', file,
+                     hashlib.sha256(CONTENT).hexdigest())
+    assert open(file, 'rb').read() == CONTENT
+    assert RangeHandler.request_range == ['bytes=1000-']
+
+
+def test_download_checksum(tmp_path, server):
+    file = str(tmp_path / 'pkg.tar.gz')
+    with pytest.raises(ValueError):
+        pkg2sig.download(server + 'pkg.tar.gz', file, '0' * 64)
+    assert not os.path.exists(file)
+    assert not os.path.exists(file + '.part')
+    assert len(RangeHandler.request_range) == pkg2sig.DOWNLOAD_RETRY
+
+
+def test_fetch_mirror(tmp_path):
+    mirror = tmp_path / 'mirror'
+    (mirror / 'aboriginal' / '1.2.5').mkdir(parents=True)
+    (mirror / 'aboriginal' / '1.2.5' / 'cross compiler.tar.gz'). \
+        write_bytes(CONTENT)
+    file = str(tmp_path / 'pkg.tar.gz')
+    url = pkg2sig.get_mirror_url(str(mirror),
+                                 'aboriginal/1.2.5/cross compiler.tar.gz')
+    assert url.startswith('file://')
+    h = pkg2sig.fetch(url, file)
+    assert open(file, 'rb').read() == CONTENT
+    # Verified by the manifest without reading it again
+    assert pkg2sig.fetch(url, file, h) == h
+    with open(file, 'wb') as f:
+        f.write(b'broken')
+    assert pkg2sig.fetch(url, file, h, verify=True) == h
+    assert open(file, 'rb').read() == CONTENT
+
+
+PKG2SIG = os.path.join(SCRIPT_DIR, 'pkg2sig.py')
+
+# Stub of pelf and sigmake which copies the input (the last but one argument)
+STUB_TOOL = '''#!/bin/sh
+for a; do src=$dst; dst=$a; done
+cp "$src" "$dst"
+'''
+
+
+# Pattern File of the Functions (pelf is replaced with the copy)
+def get_pattern(function):
+    line = []
+    for name in function:
+        lead = hashlib.sha256(name.encode()).hexdigest()[:64].upper()
+        line.append('{} 00 0000 0010 :0000 {} :0000 __GI_{}\n'.
+                    format(lead, name, name))
+    return (''.join(line) + '---\n').encode()
+
+
+def get_library(name, library):
+    label = name.split('-')[-1]
+    version = name.split('-')[1]
+    function = ['{}_{}_{}'.format(library, label, i) for i in range(4)]
+    function += ['{}_{}_{}_{}'.format(library, label, version, i)
+                 for i in range(2)]
+    return get_pattern(function)
+
+
+def write_package(file, member):
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with tarfile.open(file, 'w') as tar:
+        for lf, data in sorted(member.items()):
+            info = tarfile.TarInfo('cross-compiler/lib/' + lf)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def get_package_path(mirror, archive):
+    return os.path.join(mirror, *archive['pkg'].split(os.sep),
+                        os.path.basename(archive['url']))
+
+
+@pytest.fixture(scope='module')
+def mirror(tmp_path_factory):
+    dir = str(tmp_path_factory.mktemp('mirror'))
+    for name, archive in pkg2sig.get_archive().items():
+        write_package(get_package_path(dir, archive),
+                      {lf + '.a': get_library(name, lf)
+                       for lf in ('libc', 'libgcc')})
+    return dir
+
+
+@pytest.fixture(scope='module')
+def stub_tool(tmp_path_factory):
+    path = tmp_path_factory.mktemp('flair') / 'stub'
+    path.write_text(STUB_TOOL)
+    path.chmod(0o755)
+    return str(path)
+
+
+def run_pkg2sig(dir, mirror, stub_tool, jobs=4, *opt):
+    subprocess.run((sys.executable, PKG2SIG, str(dir), '--pelf', stub_tool,
+                    '--sigmake', stub_tool, '--mirror', mirror,
+                    '-j', str(jobs)) + opt,
+                   check=True, stdout=subprocess.PIPE)
+
+
+# Pattern File of the Module Lines
+def write_pattern(file, line, mtime_ns=None):
+    with open(file, 'w', newline='\n') as f:
+        f.write(''.join(s + '\n' for s in line) + '---\n')
+    if mtime_ns is not None:
+        os.utime(file, ns=(mtime_ns, mtime_ns))
+
+
+def test_dedup_pattern_restored(tmp_path):
+    build = pkg2sig.BuildManifest(str(tmp_path / 'build.json'))
+    a, c, backup = (str(tmp_path / n) for n in ('_a.pat', '_c.pat', 'backup'))
+    write_pattern(a, ['0' * 64 + ' 00 0000 0004 :0000 a'])
+    write_pattern(c, ['0' * 64 + ' 00 0000 0004 :0000 a'])
+    # Backup of the other content of the same size with an old mtime
+    write_pattern(backup, ['0' * 64 + ' 00 0000 0004 :0000 c'], 10 ** 18)
+    assert pkg2sig.dedup_pattern([a, c], build) == [a]
+    with open(c) as f:
+        assert f.read() == '_a\n'
+    shutil.copy2(backup, c)
+    assert pkg2sig.dedup_pattern([a, c], build) == [a, c]
+    with open(c) as f:
+        assert f.read().endswith(' c\n---\n')
+
+
+def test_dedup_pattern_function(tmp_path):
+    build = pkg2sig.BuildManifest(str(tmp_path / 'build.json'))
+    a, b = (str(tmp_path / n) for n in ('_a.pat', '_b.pat'))
+    line = ['0' * 64 + ' 00 0000 0004 :0000 ' + n for n in 'ab']
+    write_pattern(a, line)
+    write_pattern(b, line[::-1])
+    assert pkg2sig.dedup_pattern([a, b], build) == [a, b]
+    assert pkg2sig.dedup_pattern([a, b], build, True) == [a]
+    assert build.digest(a) != build.digest(a, True)
+
+
+# Files of the Build except the Packages and the Caches
+def get_output(dir):
+    ret = {}
+    for root, _, file in os.walk(dir):
+        for n in file:
+            path = os.path.join(root, n)
+            rel = os.path.relpath(path, dir)
+            if rel.startswith('pkg' + os.sep) or n == 'build.json':
+                continue
+            with open(path, 'rb') as f:
+                ret[rel] = f.read()
+    return ret
+
+
+def test_build_parallel_equals_serial(tmp_path, mirror, stub_tool):
+    run_pkg2sig(tmp_path / 'serial', mirror, stub_tool, 1)
+    run_pkg2sig(tmp_path / 'parallel', mirror, stub_tool, 8)
+    serial = get_output(tmp_path / 'serial')
+    assert os.path.join('sig', 'arm',
+                        '_libc_aboriginal-1.2.5-armv4l.sig') in serial
+    assert os.path.join('sig', 'arm', 'family.json') in serial
+    assert 'name_alternate.csv' in serial
+    assert get_output(tmp_path / 'parallel') == serial
+
+
+# Mirror whose package of the name has the libraries of the other packages
+def copy_mirror(mirror, dir, name, library):
+    shutil.copytree(mirror, dir)
+    archive = pkg2sig.get_archive()
+    write_package(get_package_path(dir, archive[name]),
+                  {lf + '.a': get_library(library.get(lf, name), lf)
+                   for lf in ('libc', 'libgcc')})
+    return dir
+
+
+def test_build_incremental_duplicate(tmp_path, mirror, stub_tool):
+    incremental = tmp_path / 'incremental'
+    run_pkg2sig(incremental, mirror, stub_tool)
+    sig = os.path.join('sig', 'arm', '_libc_aboriginal-1.2.8-armv4l.sig')
+    assert sig in get_output(incremental)
+    # libc.a of 1.2.8 becomes the same as 1.2.5
+    lib = os.path.join(str(incremental), 'lib', 'arm',
+                       '_libc_aboriginal-{}-armv4l.a')
+    shutil.copyfile(lib.format('1.2.5'), lib.format('1.2.8'))
+    run_pkg2sig(incremental, mirror, stub_tool)
+    changed = copy_mirror(mirror, str(tmp_path / 'mirror'),
+                          'aboriginal-1.2.8-armv4l',
+                          {'libc': 'aboriginal-1.2.5-armv4l'})
+    run_pkg2sig(tmp_path / 'clean', changed, stub_tool)
+    output = get_output(incremental)
+    assert sig not in output
+    assert output[os.path.join('pat', 'arm',
+                               '_libc_aboriginal-1.2.8-armv4l.pat')] \
+        == b'_libc_aboriginal-1.2.5-armv4l\n'
+    assert output == get_output(tmp_path / 'clean')
+
+
+def test_build_outdated_family(tmp_path, mirror, stub_tool):
+    run_pkg2sig(tmp_path, mirror, stub_tool)
+    output = get_output(tmp_path)
+    # Family of the former hierarchy without the build manifest
+    old = 'family_libc_aboriginal-1.2.4-1.2.9-armv4l'
+    new = 'family_libc_aboriginal-1.2.4-1.2.8-armv4l'
+    for path in (os.path.join(str(tmp_path), 'sig', 'arm', '{}.sig'),
+                 os.path.join(str(tmp_path), 'pat', 'arm', 'family',
+                              '{}.pat')):
+        shutil.copyfile(path.format(old), path.format(new))
+    os.remove(os.path.join(str(tmp_path), 'build.json'))
+    run_pkg2sig(tmp_path, mirror, stub_tool)
+    assert get_output(tmp_path) == output
+
+
+# Name Files of the Patterns in the Directory with a New Build Manifest
+def get_name_file(pattern, dir):
+    os.makedirs(dir)
+    build = pkg2sig.BuildManifest(os.path.join(dir, 'build.json'))
+    pkg2sig.write_name_file(build, pattern, dir)
+    return get_output(dir)
+
+
+def test_name_file_incremental(tmp_path, monkeypatch):
+    pat = {n: str(tmp_path / n) for n in ('_libc_a.pat', '_libc_b.pat',
+                                          '_libgcc_a.pat', '_libgcc_b.pat')}
+    for n, name in (('_libc_a.pat', 'a'), ('_libgcc_a.pat', 'g')):
+        write_pattern(pat[n], ['0' * 64 + ' 00 0000 0004 :0000 {} :0000 '
+                               '__GI_{}'.format(name, name)])
+    build = pkg2sig.BuildManifest(str(tmp_path / 'build.json'))
+    pkg2sig.write_name_file(build, sorted(pat.values())[::2], str(tmp_path))
+    # Only the added patterns are read
+    for n, name in (('_libc_b.pat', 'a'), ('_libgcc_b.pat', 'h')):
+        write_pattern(pat[n], ['0' * 64 + ' 00 0000 0004 :0000 {} :0000 '
+                               '{}_b'.format(name, name)])
+    read = []
+    read_pattern = pkg2sig.alias.read_pattern
+    monkeypatch.setattr(pkg2sig.alias, 'read_pattern',
+                        lambda f: read.append(f) or read_pattern(f))
+    pkg2sig.write_name_file(build, sorted(pat.values()), str(tmp_path))
+    assert sorted(read) == [pat['_libc_b.pat'], pat['_libgcc_b.pat']]
+    output = get_output(tmp_path)
+    assert output['name_alternate.csv'] == b'a,a_b,__GI_a\ng,__GI_g\nh,h_b\n'
+    assert output['name_ignore.txt'] == b'__GI_g\ng\nh\nh_b\n'
+    assert {k: output[k] for k in ('name_alternate.csv', 'name_ignore.txt')} \
+        == get_name_file(sorted(pat.values()), str(tmp_path / 'clean'))
+    # All the patterns are read if a pattern is removed
+    del read[:]
+    pkg2sig.write_name_file(build, sorted(pat.values())[1:], str(tmp_path))
+    assert len(read) == 3
+    output = get_output(tmp_path)
+    assert {k: output[k] for k in ('name_alternate.csv', 'name_ignore.txt')} \
+        == get_name_file(sorted(pat.values())[1:], str(tmp_path / 'removed'))
@@ -0,0 +1,255 @@
+import collections
+import concurrent.futures
+import math
+import os
+import random
+import re
+import stat
+import sys
+
+import pytest
+
+import fakeida
+import prepare
+from conftest import SCRIPT_DIR
+
+ALTERNATE = 'memcpy,__GI_memcpy\nstrlen,__GI_strlen,__strlen\n'
+DECLARATION = 'void *memcpy(void *dest, const void *src, size_t n);\n' \
+    'size_t strlen(const char *s);\n'
+
+
+# Entropy of the Chunks (numpy.bincount if it is installed, or Counter)
+@pytest.mark.parametrize('npy', [False, True])
+def test_entropy(tmp_path, monkeypatch, npy):
+    if npy:
+        pytest.importorskip('numpy')
+    monkeypatch.setattr(prepare, 'npy', npy)
+    monkeypatch.setattr(prepare, 'CHUNK_SIZE', 1000)
+    rnd = random.Random(0)
+    data = bytes(rnd.choice(b'abcd') for _ in range(5000)) \
+        + bytes(rnd.getrandbits(8) for _ in range(2500))
+    file = str(tmp_path / 'sample')
+    with open(file, 'wb') as f:
+        f.write(data)
+    expect = -sum(c / len(data) * math.log(c / len(data), 2)
+                  for c in collections.Counter(data).values())
+    assert prepare.entropy(file) == pytest.approx(expect)
+    assert prepare.histogram(data) == [data.count(i) for i in range(256)]
+
+
+def lookup(file, alternate, declaration):
+    index = prepare.NameIndex(file, alternate, declaration)
+    ret = (index.canonical('__strlen'), index.declaration('__GI_memcpy'),
+           index.canonical('printf'))
+    index.close()
+    return ret
+
+
+def test_name_index_concurrent(tmp_path):
+    alternate = str(tmp_path / 'name_alternate.csv')
+    declaration = str(tmp_path / 'prepare.txt')
+    file = str(tmp_path / 'prepare.idx')
+    with open(alternate, 'w') as f:
+        f.write(ALTERNATE)
+    with open(declaration, 'w') as f:
+        f.write(DECLARATION)
+    expect = ('strlen', 'void *memcpy(void *dest, const void *src, size_t n);',
+              None)
+    with concurrent.futures.ProcessPoolExecutor(4) as executor:
+        ret = list(executor.map(lookup, [file] * 16, [alternate] * 16,
+                                [declaration] * 16))
+    assert ret == [expect] * 16
+    # Mapped from the file without rebuilding
+    index = prepare.NameIndex(file, alternate, declaration)
+    assert index.map is not None
+    index.close()
+    assert lookup(file, alternate, declaration) == expect
+    assert sorted(os.listdir(tmp_path)) == ['name_alternate.csv',
+                                            'prepare.idx', 'prepare.txt']
+
+
+def test_write_atomic_mode(tmp_path, monkeypatch):
+    file = str(tmp_path / 'prepare.idx')
+    umask = os.umask(0o027)
+    try:
+        prepare.write_atomic(file, b'a')
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(file).st_mode) == 0o640
+    os.chmod(file, 0o604)
+    prepare.write_atomic(file, b'b')
+    assert stat.S_IMODE(os.stat(file).st_mode) == 0o604
+    with open(file, 'rb') as f:
+        assert f.read() == b'b'
+    assert sorted(os.listdir(tmp_path)) == ['prepare.idx']
+    monkeypatch.setenv('IDAFLIRT_CACHE', str(tmp_path / 'cache'))
+    assert prepare.get_cache_dir() == str(tmp_path / 'cache')
+    assert os.path.isdir(str(tmp_path / 'cache'))
+
+
+def get_module(*module):
+    return [sys.modules.get(k) for k in ('idc', 'idautils', 'idaapi')] \
+        + [getattr(m, k, None) for m in module
+           for k in ('idc', 'idautils', 'idaapi')]
+
+
+def test_install_restore():
+    before = get_module(prepare)
+    with fakeida.install(fakeida.Database(), prepare) as outer:
+        with fakeida.install(fakeida.Database(), prepare) as inner:
+            assert get_module(prepare) == list(inner) * 2
+        assert get_module(prepare) == list(outer) * 2
+    assert get_module(prepare) == before
+
+
+def test_declaration_cache(tmp_path):
+    file = str(tmp_path / 'prepare_decl.json')
+    with fakeida.install(fakeida.Database(), prepare):
+        cache = prepare.DeclarationCache(file, 'gnulnx_arm')
+        pt = cache.parse('size_t strlen(const char *s);')
+        cache.save()
+        assert sorted(os.listdir(tmp_path)) == ['prepare_decl.json']
+        cache = prepare.DeclarationCache(file, 'gnulnx_arm')
+        assert not cache.dirty
+        assert cache.parse('size_t strlen(const char *s);') == pt
+        assert not cache.dirty
+
+
+# Sequential Passes before the Analysis Pass (the reference of the results)
+def reference_init_idb(alternate, declaration):
+    idc = prepare.idc
+    idautils = prepare.idautils
+    # functionalize_single_instruction
+    seg = idc.get_first_seg()
+    while seg != idc.BADADDR:
+        ea = idc.get_segm_start(seg)
+        end = idc.get_segm_end(seg)
+        st = idc.BADADDR
+        while ea < end:
+            if idc.is_code(idc.get_full_flags(ea)) \
+                    and idc.get_func_flags(ea) == -1:
+                if st == idc.BADADDR:
+                    st = ea
+            elif st != idc.BADADDR:
+                for xref in idautils.XrefsTo(ea):
+                    if not st <= xref.frm < ea:
+                        idc.add_func(st, ea)
+                        st = idc.BADADDR
+                        break
+            ea = idc.get_item_end(ea)
+        if st != idc.BADADDR:
+            idc.add_func(st, ea)
+        seg = idc.get_next_seg(seg)
+    # true_up_function_name
+    libfunc = {}
+    with open(alternate) as f:
+        for s in f:
+            e = s.strip().split(',')
+            libfunc.update({k: e[0] for k in e})
+    for ea in idautils.Functions():
+        name = idc.get_name(ea)
+        if name in libfunc:
+            truename = libfunc[name]
+            if name != truename \
+                    and idc.get_name_ea_simple(truename) == idc.BADADDR:
+                idc.set_name(ea, truename)
+            flags = idc.get_func_flags(ea)
+            if flags != -1 and not flags & idc.FUNC_LIB:
+                idc.set_func_flags(ea, flags | idc.FUNC_LIB)
+    # get_c_main and register_c_main
+    addr = idc.get_name_ea_simple('main')
+    r = re.compile(r'main_([0-9A-Fa-f]+)')
+    seg = idc.get_first_seg()
+    while seg != idc.BADADDR and addr == idc.BADADDR:
+        ea = idc.get_segm_start(seg)
+        end = idc.get_segm_end(seg)
+        while ea < end:
+            m = r.fullmatch(idc.get_name(ea))
+            if m and int(m.group(1), 16) == ea:
+                addr = ea
+                break
+            ea = idc.get_item_end(ea)
+        seg = idc.get_next_seg(seg)
+    if addr == idc.BADADDR:
+        addr = set()
+        ea = idc.get_inf_attr(idc.INF_START_EA)
+        ed = idc.get_func_attr(ea, idc.FUNCATTR_END)
+        ea = idc.get_func_attr(ea, idc.FUNCATTR_START)
+        while ea < ed:
+            for xref in idautils.XrefsFrom(ea):
+                if xref.type == idc.dr_O \
+                        and not idc.hasName(idc.get_full_flags(xref.to)):
+                    addr.add(xref.to)
+            ea = idc.get_item_end(ea)
+        if len(addr) == 1:
+            addr = addr.pop()
+            idc.set_name(addr, 'main_{:X}'.format(addr))
+    # apply_function_type
+    decl = {}
+    with open(declaration) as f:
+        r = re.compile(r'.*?(\w+)\s*\(.*')
+        for s in map(lambda s: s.strip(), f):
+            m = r.fullmatch(s)
+            if m:
+                decl[m.group(1)] = s
+    with open(alternate) as f:
+        for s in f:
+            e = s.strip().split(',')
+            for n1 in e:
+                if n1 not in decl:
+                    for n2 in e:
+                        if n2 in decl:
+                            decl[n1] = decl[n2]
+                            break
+    r = re.compile(r'(\w+?)(_[0-9a-fA-F]+)')
+    seg = idc.get_first_seg()
+    while seg != idc.BADADDR:
+        ea = idc.get_segm_start(seg)
+        end = idc.get_segm_end(seg)
+        while ea < end:
+            name = idc.get_name(ea, idc.GN_VISIBLE)
+            if name:
+                api = name if name in decl else None
+                m = r.fullmatch(name)
+                if not api and m and m.group(1) in decl:
+                    api = m.group(1)
+                if api:
+                    pt = idc.parse_decl(decl[api], idc.PT_SILENT)
+                    if pt is not None:
+                        idc.apply_type(ea, pt)
+            ea = idc.get_item_end(ea)
+        seg = idc.get_next_seg(seg)
+
+
+def get_state(db):
+    return (db.func, db.func_end, db.func_flags, db.name, db.type)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_init_idb_equals_sequential(tmp_path, seed):
+    alternate = os.path.join(SCRIPT_DIR, os.pardir, 'deliverable',
+                             'name_alternate.csv')
+    declaration = os.path.join(SCRIPT_DIR, 'prepare.txt')
+    name = fakeida.FUNCTION_NAME + ('__GI_memcpy', '__GI_strlen',
+                                    '__malloc0', '__GI_printf')
+    db = fakeida.generate(20000, seed, name)
+    with fakeida.install(db, prepare):
+        reference_init_idb(alternate, declaration)
+    expect = get_state(db)
+    assert db.type and any(n.startswith('main_') for n in db.name.values())
+
+    db = fakeida.generate(20000, seed, name)
+    db.idb_path = str(tmp_path / 'fakeida.idb')
+    with fakeida.install(db, prepare):
+        prepare.name_index = prepare.NameIndex(str(tmp_path / 'prepare.idx'),
+                                               alternate, declaration)
+        prepare.decl_cache = prepare.DeclarationCache(
+            str(tmp_path / 'decl.json'), prepare.get_type_library())
+        prepare.initialized = False
+        try:
+            prepare.init_idb()
+        finally:
+            prepare.name_index.close()
+            prepare.name_index = None
+            prepare.decl_cache = None
+    assert get_state(db) == expect
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+import similar
+
+
+# Chain of the Patterns: the Neighbors are Similar, the Ends are Not
+def test_cluster_chain():
+    feature = {'_{}_1.0.pat'.format(c): set(range(i, i + 10))
+               for i, c in enumerate('abcd')}
+    cluster = similar.get_cluster(feature, 0.8)
+    assert cluster == [{'representative': '_b_1.0.pat',
+                        'member': {'_a_1.0.pat': 9 / 11,
+                                   '_b_1.0.pat': 1.0,
+                                   '_c_1.0.pat': 9 / 11}}]
+    mapping = similar.get_mapping(feature, cluster)
+    assert mapping == {'_b_1.0.sig': ['_a_1.0.sig', '_b_1.0.sig',
+                                      '_c_1.0.sig'],
+                       '_d_1.0.sig': ['_d_1.0.sig']}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_cluster_threshold(seed):
+    rnd = random.Random(seed)
+    base = [set(rnd.sample(range(1000), 50)) for _ in range(5)]
+    feature = {}
+    for i in range(60):
+        f = set(rnd.choice(base))
+        for _ in range(rnd.randrange(8)):
+            f.discard(rnd.choice(sorted(f)))
+            f.add(rnd.randrange(1000))
+        feature['_{}_1.0.pat'.format(i)] = f
+    threshold = 0.8
+    cluster = similar.get_cluster(feature, threshold)
+    assert cluster
+    name = [m for c in cluster for m in c['member']]
+    assert len(name) == len(set(name))
+    for c in cluster:
+        representative = c['representative']
+        assert c['member'][representative] == 1.0
+        for m, s in c['member'].items():
+            assert s == similar.jaccard(feature[representative], feature[m])
+            assert s >= threshold